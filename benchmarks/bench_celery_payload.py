@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Compares Celery payloads of custom tasks: whole message document (`msgdoc.json_dict()`)
+versus reference to it (`task_payloads.make_reference`).
+
+Prints serialized body sizes, then enqueue latency through the configured broker.
+With `--with-db` it also measures worker-side hydration through `document_reader`,
+cold (read from Mongo) and warm (LRU hit).
+
+Requires running Redis (and MongoDB for `--with-db`) configured via .env, run from the repo root:
+    PYTHONPATH=bot python benchmarks/bench_celery_payload.py --tasks 1000 --media 10
+"""
+
+import argparse
+import time
+from datetime import datetime
+
+from kombu.utils.json import dumps
+
+from celery_app import app
+from repositories import db
+from task_payloads import document_reader, make_reference
+
+BENCH_QUEUE = "bench_payloads"
+BENCH_TASK_NAME = "bench.payload"
+COLLECTION_NAME = "bench_payloads"
+
+
+def build_document(media_count: int) -> dict:
+    # shaped as saved photo message with caption: entities, photo sizes and message info
+    return {
+        "message_id": 1024,
+        "date": datetime.utcnow().isoformat(),
+        "chat": {"id": 123456789, "type": "private", "first_name": "bench", "username": "bench"},
+        "from_user": {"id": 123456789, "is_bot": False, "first_name": "bench", "language_code": "en"},
+        "forward_from_chat": {"id": -1001234567890, "type": "channel", "title": "Bench channel"},
+        "caption": "lorem ipsum https://example.com/path?query=value " * 8,
+        "caption_entities": [
+            {"type": "url", "offset": idx * 51 + 12, "length": 38} for idx in range(8)
+        ],
+        "media_group_id": "13579246801357924",
+        "photo": [
+            {
+                "file_id": "AgACAgIAAxkBAAI" + "x" * 60 + str(idx),
+                "file_unique_id": "AQADx" + "y" * 10 + str(idx),
+                "width": 90 * (idx + 1),
+                "height": 60 * (idx + 1),
+                "file_size": 1500 * (idx + 1),
+            }
+            for idx in range(media_count)
+        ],
+        "cb_message_info": {
+            "action": "DEL1",
+            "actions": {code: {} for code in ("KEEP", "DEL_REQ", "DOWNLOAD", "DWNLD_ALL", "PLG1")},
+            "perform_action_at": int(time.time()) + 600,
+            "reply_action_message_id": 1025,
+            "entities": [],
+        },
+    }
+
+
+def body_size(task_args: dict, msgdoc_payload: dict) -> int:
+    # celery's protocol 2 body: (args, kwargs, embed)
+    return len(dumps(((task_args, msgdoc_payload), {}, {})))
+
+
+def measure_enqueue(tasks: int, task_args: dict, msgdoc_payload: dict) -> dict[str, float]:
+    latencies = []
+    for _ in range(tasks):
+        started_at = time.perf_counter()
+        app.send_task(BENCH_TASK_NAME, args=(task_args, msgdoc_payload), queue=BENCH_QUEUE)
+        latencies.append(time.perf_counter() - started_at)
+
+    latencies.sort()
+    return {
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95)] * 1000,
+        "tasks_per_s": tasks / sum(latencies),
+    }
+
+
+def measure_hydration(document: dict, reads: int) -> dict[str, float]:
+    entry_id = db.insert(COLLECTION_NAME, dict(document)).data["_id"]
+    reference = make_reference(entry_id, COLLECTION_NAME)
+
+    started_at = time.perf_counter()
+    document_reader.get(reference)
+    cold = time.perf_counter() - started_at
+
+    started_at = time.perf_counter()
+    for _ in range(reads):
+        document_reader.get(reference)
+    warm = (time.perf_counter() - started_at) / reads
+
+    db.get_mongo_db().drop_collection(COLLECTION_NAME)
+    return {"cold_ms": cold * 1000, "warm_us": warm * 1_000_000}
+
+
+def main(args) -> None:
+    document = build_document(args.media)
+    task_args = {"data": ["https://example.com/path?query=value"]}
+    payloads = (
+        ("full", document),
+        ("reference", make_reference("65a1b2c3d4e5f6a7b8c9d0e1", "new_messages")),
+    )
+
+    for name, msgdoc_payload in payloads:
+        print(name.ljust(10), f"body_bytes={body_size(task_args, msgdoc_payload)}")
+
+    for name, msgdoc_payload in payloads:
+        stats = measure_enqueue(args.tasks, task_args, msgdoc_payload)
+        print(name.ljust(10), "  ".join(f"{k}={v:.2f}" for k, v in stats.items()))
+
+    with app.connection_for_write() as connection:
+        connection.default_channel.queue_purge(BENCH_QUEUE)
+
+    if args.with_db:
+        stats = measure_hydration(document, args.tasks)
+        print("hydration ", "  ".join(f"{k}={v:.2f}" for k, v in stats.items()))
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tasks", type=int, default=1000)
+    parser.add_argument("--media", type=int, default=4)
+    parser.add_argument("--with-db", action="store_true")
+    main(parser.parse_args())
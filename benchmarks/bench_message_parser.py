@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Compares matching of custom actions' patterns against message text:
+recompiling pattern of every action per message (as before), scanning text by every
+precompiled pattern, and `ActionsMatcher`, which scans text only by patterns whose
+required literal is found in it.
+
+Actions are synthetic and similar to plugins' ones: links of different sites,
+hashtags, mentions, prices, dates. Captions mix matching and plain text.
+
+Run from the repo root with .env configured:
+    PYTHONPATH=bot python benchmarks/bench_message_parser.py --actions 60 --length 4000
+"""
+
+import argparse
+import random
+import re
+import time
+
+from models import CustomMessageAction
+from services.savmes.message_parser import ActionsMatcher
+
+WORDS = ("lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing", "elit", "sed", "do")
+
+
+def build_actions(count: int) -> list[CustomMessageAction]:
+    generic = (
+        r"#\w+",
+        r"@\w{5,}",
+        r"\$\d+(?:\.\d\d)?",
+        r"\b\d{4}-\d{2}-\d{2}\b",
+        r"\b[\w.]+@[\w-]+\.\w+\b",
+        r"\b(?:todo|fixme)\b:?\s*\S+",
+    )
+    patterns = list(generic)
+    for idx in range(count - len(generic)):
+        patterns.append(rf"https?://(?:www\.)?site{idx}\.(?:com|org)/\S+")
+
+    return [
+        CustomMessageAction(
+            code=f"B{idx}",
+            caption=f"Bench {idx}",
+            order=1000 + idx,
+            method_args={"task_name": f"plugins.bench{idx}.tasks.Task", "regex": pattern},
+        )
+        for idx, pattern in enumerate(patterns)
+    ]
+
+
+def build_caption(length: int, actions_count: int, rnd: random.Random) -> str:
+    chunks, size = [], 0
+    while size < length:
+        roll = rnd.random()
+        if roll < 0.03:
+            chunk = f"https://site{rnd.randrange(actions_count * 2)}.com/watch?v={rnd.randrange(10 ** 6)}"
+        elif roll < 0.05:
+            chunk = rnd.choice(("#music", "@someuser", "$12.50", "2023-10-01", "me@mail.io", "TODO: fix"))
+        else:
+            chunk = rnd.choice(WORDS)
+        chunks.append(chunk)
+        size += len(chunk) + 1
+    return " ".join(chunks)
+
+
+def match_recompiling(actions: list[CustomMessageAction], text: str) -> dict[str, list[str]]:
+    return {
+        action.code: [m.group() for m in re.compile(action.regex_pattern, re.IGNORECASE).finditer(text)]
+        for action in actions
+    }
+
+
+def match_precompiled(actions: list[CustomMessageAction], text: str) -> dict[str, list[str]]:
+    return {action.code: [m.group() for m in action.pattern.finditer(text)] for action in actions}
+
+
+def measure(func, texts: list[str], rounds: int) -> float:
+    started_at = time.perf_counter()
+    for _ in range(rounds):
+        for text in texts:
+            func(text)
+    return (time.perf_counter() - started_at) / (rounds * len(texts))
+
+
+def main(args) -> None:
+    rnd = random.Random(args.seed)
+    actions = build_actions(args.actions)
+    matcher = ActionsMatcher(actions)
+    texts = [build_caption(args.length, args.actions, rnd) for _ in range(args.messages)]
+
+    for text in texts:
+        expected = match_precompiled(actions, text)
+        assert matcher.match(text) == expected, "Matcher differs from per-action patterns"
+
+    variants = (
+        ("recompiling", lambda text: match_recompiling(actions, text)),
+        ("precompiled", lambda text: match_precompiled(actions, text)),
+        ("matcher", matcher.match),
+    )
+    for name, func in variants:
+        per_message = measure(func, texts, args.rounds)
+        print(name.ljust(12), f"us_per_message={per_message * 1_000_000:.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--actions", type=int, default=60)
+    parser.add_argument("--length", type=int, default=4000)
+    parser.add_argument("--messages", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    main(parser.parse_args())
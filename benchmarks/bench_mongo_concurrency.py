@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Compares handling of concurrent updates with the blocking (`repositories.db`)
+and asyncio-native (`repositories.db_async`) Mongo repositories.
+
+Every simulated update does the same round trips as a received message:
+insert, select, update, delete. A probe coroutine measures event loop lag
+meanwhile, which is what polling, callback answers and scheduled jobs suffer from.
+
+Requires running MongoDB configured via .env, run from the repo root:
+    PYTHONPATH=bot python benchmarks/bench_mongo_concurrency.py --updates 500 --concurrency 50
+"""
+
+import argparse
+import asyncio
+import time
+
+from repositories import db, db_async
+
+COLLECTION_NAME = "bench_updates"
+
+
+async def handle_update_sync(idx: int) -> None:
+    result = db.insert(COLLECTION_NAME, {"message_id": idx, "text": "x" * 256})
+    entry_id = result.data["_id"]
+    db.select(COLLECTION_NAME, entry_id)
+    db.update(COLLECTION_NAME, entry_id, {"cb_message_info.perform_action_at": idx})
+    db.delete_many(COLLECTION_NAME, [entry_id])
+
+
+async def handle_update_async(idx: int) -> None:
+    result = await db_async.insert(COLLECTION_NAME, {"message_id": idx, "text": "x" * 256})
+    entry_id = result.data["_id"]
+    await db_async.select(COLLECTION_NAME, entry_id)
+    await db_async.update(COLLECTION_NAME, entry_id, {"cb_message_info.perform_action_at": idx})
+    await db_async.delete_many(COLLECTION_NAME, [entry_id])
+
+
+async def probe_loop_lag(stop: asyncio.Event, lags: list[float], interval: float = 0.01) -> None:
+    while not stop.is_set():
+        started_at = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - started_at - interval)
+
+
+async def run(handler, updates: int, concurrency: int) -> dict[str, float]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def _handle(idx: int) -> None:
+        async with semaphore:
+            started_at = time.perf_counter()
+            await handler(idx)
+            latencies.append(time.perf_counter() - started_at)
+
+    stop, lags = asyncio.Event(), []
+    probe = asyncio.create_task(probe_loop_lag(stop, lags))
+    started_at = time.perf_counter()
+    await asyncio.gather(*(_handle(idx) for idx in range(updates)))
+    elapsed = time.perf_counter() - started_at
+    stop.set()
+    await probe
+
+    latencies.sort()
+    return {
+        "elapsed_s": elapsed,
+        "updates_per_s": updates / elapsed,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95)] * 1000,
+        "max_loop_lag_ms": max(lags, default=0) * 1000,
+    }
+
+
+async def main(args) -> None:
+    for name, handler in (("sync", handle_update_sync), ("async", handle_update_async)):
+        stats = await run(handler, args.updates, args.concurrency)
+        print(name.ljust(6), "  ".join(f"{k}={v:.2f}" for k, v in stats.items()))
+
+    await db_async.get_mongo_db().drop_collection(COLLECTION_NAME)
+    db_async.close()
+    db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Compares update ingestion of long polling and webhook modes on one machine.
+
+Starts fake Bot API server, which serves synthetic text messages through `getUpdates`
+(`--mode polling`) or POSTs them to bot's webhook (`--mode webhook`), and waits for
+bot's replies to them ("Choose action for this message"). Prints throughput and
+latency from update being available to reply being received. Raise
+`CERRRBOT_TELEGRAM_*` rate limits of the bot, otherwise they're what is measured.
+
+Bot must be started separately against fake server, with Mongo and Redis running:
+    BOT_TOKEN=123456:bench ALLOWED_USERS=1000 CERRRBOT_TELEGRAM_GLOBAL_RATE=100000 \\
+        CERRRBOT_TELEGRAM_CHAT_RATE=100000 CERRRBOT_TELEGRAM_API_SERVER=http://127.0.0.1:8081 \\
+        CERRRBOT_UPDATES_MODE=webhook CERRRBOT_WEBHOOK_URL=http://127.0.0.1:8080/webhook \\
+        python bot/main.py
+    python benchmarks/bench_updates.py --mode webhook --updates 2000 --user-id 1000
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from aiohttp import ClientSession, web
+
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class FakeBotAPI:
+    def __init__(self, args):
+        self.args = args
+        self.updates: list[dict] = []
+        self.new_updates = asyncio.Event()
+        self.available_at: dict[int, float] = {}
+        self.replied_at: dict[int, float] = {}
+        self.done = asyncio.Event()
+        self.calls: dict[str, int] = {}
+        self.webhook_set = asyncio.Event()
+        self.polling = asyncio.Event()
+        self.secret_token = ""
+        self._message_id = 10 ** 9
+
+    def add_update(self, update: dict) -> None:
+        self.updates.append(update)
+        self.available_at[update["message"]["message_id"]] = time.monotonic()
+        self.new_updates.set()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] = self.calls.get(method, 0) + 1
+        data = dict(await request.post())
+        handler = getattr(self, "on_" + method, None)
+        result = await handler(data) if handler else True
+        return web.json_response({"ok": True, "result": result})
+
+    async def on_getMe(self, data: dict) -> dict:
+        return {"id": 123456, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+
+    async def on_setWebhook(self, data: dict) -> bool:
+        self.secret_token = data.get("secret_token", "")
+        self.webhook_set.set()
+        return True
+
+    async def on_getUpdates(self, data: dict) -> list[dict]:
+        self.polling.set()
+        offset = int(data.get("offset") or 0)
+        deadline = time.monotonic() + int(data.get("timeout") or 0)
+        while True:
+            pending = [u for u in self.updates if u["update_id"] >= offset]
+            if pending or time.monotonic() >= deadline:
+                return pending[:100]
+            self.new_updates.clear()
+            try:
+                await asyncio.wait_for(self.new_updates.wait(), deadline - time.monotonic())
+            except asyncio.TimeoutError:
+                pass
+
+    async def on_sendMessage(self, data: dict) -> dict:
+        reply_to = int(data.get("reply_to_message_id") or 0)
+        if reply_to in self.available_at and reply_to not in self.replied_at:
+            self.replied_at[reply_to] = time.monotonic()
+            if len(self.replied_at) == self.args.updates:
+                self.done.set()
+
+        self._message_id += 1
+        return {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": int(data["chat_id"]), "type": "private"},
+            "text": data.get("text", ""),
+        }
+
+
+def build_update(idx: int, args) -> dict:
+    chat_id = args.user_id + idx % args.chats
+    return {
+        "update_id": idx + 1,
+        "message": {
+            "message_id": idx + 1,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": args.user_id, "is_bot": False, "first_name": "bench"},
+            "text": f"bench message {idx} https://example.com/{idx}",
+        },
+    }
+
+
+async def post_updates(api: FakeBotAPI, args) -> dict[int, int]:
+    statuses: dict[int, int] = {}
+    semaphore = asyncio.Semaphore(args.concurrency)
+    # bot's secret is taken from setWebhook call unless given
+    secret = args.secret or api.secret_token
+    headers = {SECRET_TOKEN_HEADER: secret} if secret else {}
+
+    async def post(session: ClientSession, update: dict) -> None:
+        async with semaphore:
+            api.available_at[update["message"]["message_id"]] = time.monotonic()
+            async with session.post(args.webhook_url, data=json.dumps(update), headers=headers) as resp:
+                statuses[resp.status] = statuses.get(resp.status, 0) + 1
+
+    async with ClientSession(headers={"Content-Type": "application/json"}) as session:
+        await asyncio.gather(*(post(session, build_update(idx, args)) for idx in range(args.updates)))
+    return statuses
+
+
+async def main(args) -> None:
+    api = FakeBotAPI(args)
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", api.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, args.api_host, args.api_port).start()
+    print(f"Fake Bot API listens on http://{args.api_host}:{args.api_port}, start the bot")
+
+    statuses = {}
+    if args.mode == "polling":
+        await api.polling.wait()
+        await asyncio.sleep(args.warmup)
+        started_at = time.monotonic()
+        for idx in range(args.updates):
+            api.add_update(build_update(idx, args))
+    else:
+        await api.webhook_set.wait()
+        await asyncio.sleep(args.warmup)
+        started_at = time.monotonic()
+        statuses = await post_updates(api, args)
+
+    try:
+        await asyncio.wait_for(api.done.wait(), args.timeout)
+    except asyncio.TimeoutError:
+        pass
+    elapsed = time.monotonic() - started_at
+    await runner.cleanup()
+
+    latencies = sorted(
+        api.replied_at[message_id] - available_at
+        for message_id, available_at in api.available_at.items()
+        if message_id in api.replied_at
+    )
+    replied = len(latencies)
+    print(f"mode={args.mode} updates={args.updates} replied={replied} elapsed={elapsed:.2f}s")
+    print(f"throughput={replied / elapsed:.1f} updates/s")
+    if latencies:
+        print(
+            "latency_ms p50={:.1f} p95={:.1f} max={:.1f}".format(
+                statistics.median(latencies) * 1000,
+                latencies[int(len(latencies) * 0.95) - 1] * 1000,
+                latencies[-1] * 1000,
+            )
+        )
+    if statuses:
+        print(f"webhook_statuses={statuses}")
+    print(f"api_calls={api.calls}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mode", choices=("polling", "webhook"), default="polling")
+    parser.add_argument("--updates", type=int, default=1000)
+    parser.add_argument("--chats", type=int, default=50)
+    parser.add_argument("--user-id", type=int, required=True)
+    parser.add_argument("--concurrency", type=int, default=40)
+    parser.add_argument("--api-host", default="127.0.0.1")
+    parser.add_argument("--api-port", type=int, default=8081)
+    parser.add_argument("--webhook-url", default="http://127.0.0.1:8080/webhook")
+    parser.add_argument("--secret", default="")
+    parser.add_argument("--warmup", type=float, default=3)
+    parser.add_argument("--timeout", type=float, default=300)
+    asyncio.run(main(parser.parse_args()))
@@ -1,9 +1,14 @@
+import logging
 import os
 from importlib import import_module
+from typing import Any
 
 from celery import Celery, Task
+from kombu import Queue
 
 from settings import (
+    CELERY_QUEUE_BULK,
+    CELERY_QUEUE_INTERACTIVE,
     REDIS_BACKEND_DB_IDX,
     REDIS_BROKER_DB_IDX,
     REDIS_HOST,
@@ -11,23 +16,88 @@ from settings import (
     PLUGINS_MODULE_NAME,
     PLUGINS_DIR_PATH
 )
+from task_payloads import ReferencePayloadMixin
+
+logger = logging.getLogger("cerrrbot")
+
+# plugins declare priority class of their tasks, each class is served by its own workers
+QUEUE_BY_PRIORITY = {
+    "interactive": CELERY_QUEUE_INTERACTIVE,
+    "bulk": CELERY_QUEUE_BULK,
+}
+ROUTING_OPTIONS = ("priority_class", "queue", "rate_limit", "soft_time_limit")
 
 
 def register_tasks(app: Celery) -> None:
     loaded_tasks = []
+    loaded_actions = []
     for plugin_name in os.listdir(PLUGINS_DIR_PATH):
         try:
             plugin_module = import_module(f"{PLUGINS_MODULE_NAME}.{plugin_name}")
         except ModuleNotFoundError:
             continue
 
-        try:
-            loaded_tasks.extend(plugin_module.tasks)
-        except AttributeError:
-            continue
+        loaded_tasks.extend(getattr(plugin_module, "tasks", ()))
+        loaded_actions.extend(getattr(plugin_module, "actions", ()))
 
+    options_by_task = {}
     for task_cls in loaded_tasks:
-        app.register_task(task_cls)
+        task = app.register_task(_with_reference_payload(app, task_cls))
+        options_by_task[task.name] = {
+            option: getattr(task_cls, option)
+            for option in ROUTING_OPTIONS
+            if getattr(task_cls, option, None) is not None
+        }
+
+    # options from actions override ones declared by task classes
+    for action in loaded_actions:
+        task_name = action.method_args.get("task_name")
+        if task_name:
+            options_by_task.setdefault(task_name, {}).update(
+                {
+                    option: action.method_args[option]
+                    for option in ROUTING_OPTIONS
+                    if option in action.method_args
+                }
+            )
+
+    _configure_routing(app, options_by_task)
+
+
+def _configure_routing(app: Celery, options_by_task: dict[str, dict[str, Any]]) -> None:
+    task_routes, task_annotations = {}, {}
+    for task_name, options in options_by_task.items():
+        priority_class = options.get("priority_class", "interactive")
+        assert priority_class in QUEUE_BY_PRIORITY, f"Unknown priority class of {task_name}: {priority_class}"
+        task_routes[task_name] = {"queue": options.get("queue") or QUEUE_BY_PRIORITY[priority_class]}
+
+        annotations = {
+            option: options[option] for option in ("rate_limit", "soft_time_limit") if option in options
+        }
+        if annotations:
+            task_annotations[task_name] = annotations
+
+    queues = {CELERY_QUEUE_INTERACTIVE, CELERY_QUEUE_BULK}
+    queues.update(route["queue"] for route in task_routes.values())
+    app.conf.update(
+        task_default_queue=CELERY_QUEUE_INTERACTIVE,
+        task_queues=[Queue(name) for name in sorted(queues)],
+        task_routes=task_routes,
+        task_annotations=task_annotations,
+    )
+    logger.info("Celery tasks routes: {}".format(task_routes))
+
+
+def _with_reference_payload(app: Celery, task_cls: type[Task]) -> Task:
+    # keeps name of original task, so it's still routed by `task_name` from plugin's actions
+    return type(
+        task_cls.__name__,
+        (ReferencePayloadMixin, task_cls),
+        {
+            "__module__": task_cls.__module__,
+            "name": task_cls.name or app.gen_task_name(task_cls.__name__, task_cls.__module__),
+        },
+    )
 
 
 class TestTask(Task):
@@ -1,14 +1,40 @@
+import asyncio
+import hashlib
 import logging
 import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
-from typing import Any, Awaitable, Callable, Optional
+from functools import partial
+from http import HTTPStatus
+from typing import Any, Awaitable, Callable, Hashable, Optional
 
+import aiohttp
 from aiogram import BaseMiddleware, Bot
+from aiogram.methods import GetFile
 from aiogram.types import Message
-from settings import ALLOWED_USERS, DATA_DIRECTORY_ROOT
+
+import file_store
+from telegram_gateway import set_background_priority, telegram_gateway
+from settings import (
+    ALLOWED_USERS,
+    DATA_DIRECTORY_ROOT,
+    DOWNLOAD_CHUNK_SIZE,
+    DOWNLOAD_MAX_CHAT_CONCURRENCY,
+    DOWNLOAD_MAX_CONCURRENCY,
+    DOWNLOAD_RETRIES,
+    DOWNLOAD_RETRY_BACKOFF,
+    DOWNLOAD_TIMEOUT,
+    DOWNLOAD_WRITE_BUFFER_CHUNKS,
+    FS_WORKERS,
+)
 
 logger = logging.getLogger("cerrrbot")
 
+_fs_executor = ThreadPoolExecutor(max_workers=FS_WORKERS, thread_name_prefix="cerrrbot-fs")
+_blob_downloads: dict[str, asyncio.Future] = {}
+
 
 @dataclass
 class AppResult:
@@ -48,6 +74,59 @@ class AppResult:
         self.data.update(app_result.data)
 
 
+class LRUCache:
+    def __init__(self, maxsize: int, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, count=False) is not None
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None, count: bool = True) -> Any:
+        try:
+            expires_at, value = self._data[key]
+        except KeyError:
+            self.misses += count
+            return default
+
+        if expires_at and expires_at < time.monotonic():
+            del self._data[key]
+            self.misses += count
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += count
+        return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+
+        expires_at = time.monotonic() + self.ttl if self.ttl else 0
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        try:
+            return self._data.pop(key)[1]
+        except KeyError:
+            return default
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> dict[str, int]:
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
 class CheckUserMiddleware(BaseMiddleware):
     async def __call__(
         self,
@@ -86,16 +165,291 @@ def get_directory_path(directory_path: str) -> os.PathLike:
     return os.path.join(DATA_DIRECTORY_ROOT, directory_path)
 
 
-async def save_file(bot: Bot, file_id: str, file_name: str, dir_name: str) -> AppResult:
+async def save_file(
+    bot: Bot,
+    file_id: str,
+    file_name: str,
+    dir_name: str,
+    file_unique_id: Optional[str] = None,
+) -> AppResult:
     dir_path = os.path.join(DATA_DIRECTORY_ROOT, dir_name)
-    if not os.path.exists(dir_path):
-        os.mkdir(dir_path)
-
     file_path = os.path.join(dir_path, file_name)
     try:
-        await bot.download(file_id, file_path)
+        await run_fs(os.makedirs, dir_path, exist_ok=True)
+        if not file_unique_id:
+            return await _stream_file(bot, file_id, file_path)
+        return await _save_file_to_store(bot, file_id, file_unique_id, file_path)
     except Exception as exc:
         logger.error(exc)
         return AppResult(False, exc)
 
-    return AppResult()
\ No newline at end of file
+
+async def _save_file_to_store(
+    bot: Bot, file_id: str, file_unique_id: str, file_path: str
+) -> AppResult:
+    blob = await run_fs(file_store.find_blob, file_unique_id)
+    stored = blob is not None
+    if stored:
+        logger.debug("Found stored file {}, skip download".format(file_unique_id))
+    else:
+        blob = await _download_blob(bot, file_id, file_unique_id)
+
+    blob_path, sha256, size = blob
+    await run_fs(file_store.link_blob, blob_path, file_path)
+    return AppResult(data={"path": file_path, "size": size, "sha256": sha256, "stored": stored})
+
+
+async def _download_blob(bot: Bot, file_id: str, file_unique_id: str) -> tuple[str, str, int]:
+    # concurrent downloads of the same file (e.g. album forwarded twice) would write
+    # to the same `.part` file, so later ones wait for the first one instead
+    in_flight = _blob_downloads.get(file_unique_id)
+    if in_flight is not None:
+        logger.debug("File {} is already being downloaded, wait for it".format(file_unique_id))
+        return await asyncio.shield(in_flight)
+
+    future = asyncio.get_running_loop().create_future()
+    _blob_downloads[file_unique_id] = future
+    try:
+        tmp_path = await run_fs(file_store.get_tmp_path, file_unique_id)
+        result = await _stream_file(bot, file_id, tmp_path)
+        blob_path = await run_fs(
+            file_store.store_blob, file_unique_id, tmp_path, result.sha256, result.size
+        )
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as exc:
+        future.set_exception(exc)
+        # marks exception as retrieved, as there may be no waiters
+        future.exception()
+        raise
+    finally:
+        del _blob_downloads[file_unique_id]
+
+    blob = (blob_path, result.sha256, result.size)
+    future.set_result(blob)
+    return blob
+
+
+def run_fs(func: Callable, *args, **kwargs) -> Awaitable:
+    loop = asyncio.get_running_loop()
+    return loop.run_in_executor(_fs_executor, partial(func, *args, **kwargs))
+
+
+async def _stream_file(bot: Bot, file_id: str, file_path: str) -> AppResult:
+    # data is written to `.part` file, which is kept on failure to resume download on retry
+    file = await telegram_gateway.call(bot, GetFile(file_id=file_id))
+    part_path = f"{file_path}.part"
+    writer = _PartFileWriter(part_path)
+    offset = await run_fs(writer.resume)
+    if file.file_size and offset > file.file_size:
+        offset = await run_fs(writer.restart)
+
+    try:
+        if file.file_size and offset == file.file_size:
+            # e.g. process stopped before complete `.part` file was committed
+            logger.debug("File {} is already downloaded, commit it".format(file.file_path))
+        else:
+            await _stream_to_writer(bot, file.file_path, writer, offset)
+    finally:
+        await run_fs(writer.close)
+
+    await run_fs(writer.commit, file_path)
+    return AppResult(data={"path": file_path, "size": writer.size, "sha256": writer.sha256})
+
+
+async def _stream_to_writer(bot: Bot, path: str, writer: "_PartFileWriter", offset: int) -> None:
+    session = await bot.session.create_session()
+    url = bot.session.api.file_url(bot.token, path)
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+    timeout = aiohttp.ClientTimeout(total=DOWNLOAD_TIMEOUT)
+    async with session.get(url, headers=headers, timeout=timeout) as response:
+        if offset and response.status == HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE:
+            # size wasn't known and `.part` file already holds whole file
+            logger.debug("File {} is already downloaded, commit it".format(path))
+            return
+        response.raise_for_status()
+        if offset and response.status != HTTPStatus.PARTIAL_CONTENT:
+            logger.debug("Range isn't supported, restart download of {}".format(path))
+            await run_fs(writer.restart)
+
+        chunks = asyncio.Queue(maxsize=DOWNLOAD_WRITE_BUFFER_CHUNKS)
+        writing = asyncio.create_task(_write_chunks(writer, chunks))
+        try:
+            async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                if writer.error:
+                    break
+                await chunks.put(chunk)
+        finally:
+            await chunks.put(None)
+            await writing
+
+    if writer.error:
+        raise writer.error
+
+
+async def _write_chunks(writer: "_PartFileWriter", chunks: asyncio.Queue) -> None:
+    # keeps consuming after failure, so producer is never blocked by full buffer
+    while (chunk := await chunks.get()) is not None:
+        if writer.error:
+            continue
+        try:
+            await run_fs(writer.write, chunk)
+        except Exception as exc:
+            writer.error = exc
+
+
+class _PartFileWriter:
+    def __init__(self, part_path: str):
+        self.part_path = part_path
+        self.size = 0
+        self.error: Optional[Exception] = None
+        self._hash = hashlib.sha256()
+        self._file = None
+
+    @property
+    def sha256(self) -> str:
+        return self._hash.hexdigest()
+
+    def resume(self) -> int:
+        self._file = open(self.part_path, "a+b")
+        self._file.seek(0)
+        while chunk := self._file.read(DOWNLOAD_CHUNK_SIZE):
+            self._hash.update(chunk)
+            self.size += len(chunk)
+        return self.size
+
+    def restart(self) -> int:
+        self._file.seek(0)
+        self._file.truncate()
+        self._hash = hashlib.sha256()
+        self.size = 0
+        return self.size
+
+    def write(self, chunk: bytes) -> None:
+        self._file.write(chunk)
+        self._hash.update(chunk)
+        self.size += len(chunk)
+
+    def close(self) -> None:
+        if self._file.closed:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+
+    def commit(self, file_path: str) -> None:
+        self.close()
+        os.replace(self.part_path, file_path)
+        dir_fd = os.open(os.path.dirname(file_path), os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+@dataclass
+class DownloadFile:
+    file_id: str
+    file_name: str
+    dir_name: str
+    file_unique_id: Optional[str] = None
+
+
+class DownloadEngine:
+    def __init__(
+        self,
+        max_concurrency: int = DOWNLOAD_MAX_CONCURRENCY,
+        max_chat_concurrency: int = DOWNLOAD_MAX_CHAT_CONCURRENCY,
+        retries: int = DOWNLOAD_RETRIES,
+        retry_backoff: float = DOWNLOAD_RETRY_BACKOFF,
+    ):
+        self.max_chat_concurrency = max_chat_concurrency
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._chat_semaphores: dict[int, tuple[asyncio.Semaphore, int]] = {}
+
+    async def download_all(self, bot: Bot, files: list[DownloadFile], chat_id: int) -> AppResult:
+        results = await asyncio.gather(
+            *(self._download_in_chat(bot, file, chat_id) for file in files)
+        )
+        result = AppResult(data={"files": {}})
+        for file, file_result in zip(files, results):
+            result.status = result.status and bool(file_result)
+            result.data["files"][file.file_name] = file_result
+        failed = [name for name, file_result in result.data["files"].items() if not file_result]
+        result.info = "Downloaded {} of {} files".format(len(files) - len(failed), len(files))
+        if failed:
+            result.info += ", failed: {}".format(failed)
+        return result
+
+    async def _download_in_chat(self, bot: Bot, file: DownloadFile, chat_id: int) -> AppResult:
+        chat_semaphore = self._acquire_chat_semaphore(chat_id)
+        try:
+            async with chat_semaphore, self._semaphore:
+                return await self._download(bot, file)
+        finally:
+            self._release_chat_semaphore(chat_id)
+
+    async def _download(self, bot: Bot, file: DownloadFile) -> AppResult:
+        for attempt in range(self.retries + 1):
+            if attempt:
+                await asyncio.sleep(self.retry_backoff * 2 ** (attempt - 1))
+            result = await save_file(
+                bot, file.file_id, file.file_name, file.dir_name, file.file_unique_id
+            )
+            if result:
+                return result
+            logger.warning(
+                "Failed to download {} (attempt {}): {}".format(file.file_name, attempt + 1, result)
+            )
+        return result
+
+    def _acquire_chat_semaphore(self, chat_id: int) -> asyncio.Semaphore:
+        semaphore, users = self._chat_semaphores.get(
+            chat_id, (asyncio.Semaphore(self.max_chat_concurrency), 0)
+        )
+        self._chat_semaphores[chat_id] = (semaphore, users + 1)
+        return semaphore
+
+    def _release_chat_semaphore(self, chat_id: int) -> None:
+        semaphore, users = self._chat_semaphores[chat_id]
+        if users > 1:
+            self._chat_semaphores[chat_id] = (semaphore, users - 1)
+        else:
+            del self._chat_semaphores[chat_id]
+
+
+_background_tasks: set[asyncio.Task] = set()
+
+
+def run_in_background(coro: Awaitable, name: Optional[str] = None) -> asyncio.Task:
+    task = asyncio.create_task(_as_background(coro), name=name)
+    _background_tasks.add(task)
+    task.add_done_callback(_on_background_task_done)
+    return task
+
+
+async def _as_background(coro: Awaitable) -> Any:
+    # task copies context of handler which started it, but nobody waits for it
+    set_background_priority()
+    return await coro
+
+
+def _on_background_task_done(task: asyncio.Task) -> None:
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception():
+        logger.error("Background task {} failed".format(task.get_name()), exc_info=task.exception())
+
+
+async def drain_background_tasks(timeout: Optional[float] = None) -> None:
+    if not _background_tasks:
+        return
+    logger.info("Waiting for {} background tasks...".format(len(_background_tasks)))
+    _, pending = await asyncio.wait(set(_background_tasks), timeout=timeout)
+    for task in pending:
+        task.cancel()
+
+
+download_engine = DownloadEngine()
@@ -1,7 +1,12 @@
 from settings import (
     DEFAULT_CACHE_KEY_PREFIX_NOTIFICATION,
+    DEFAULT_CACHE_KEY_PREFIX_TASK_RESULT,
     DEFAULT_CHECK_FOR_NEW_MESSAGES_TIMEOUT,
-    DEFAULT_CHECK_FOR_DEPRECATED_MESSAGES_TIMEOUT
+    DEFAULT_CHECK_FOR_DEPRECATED_MESSAGES_TIMEOUT,
+    DEFAULT_NOTIFICATIONS_BATCH_SIZE,
+    DEFAULT_NOTIFICATIONS_CLAIM_TIMEOUT,
+    DEFAULT_NOTIFICATIONS_MAX_CONCURRENCY,
+    DEFAULT_NOTIFICATIONS_MERGE_WINDOW,
 )
 
 
@@ -10,5 +15,17 @@ CHECK_FOR_DEPRECATED_MESSAGES_TIMEOUT = DEFAULT_CHECK_FOR_DEPRECATED_MESSAGES_TI
 CHECK_FOR_NOTIFICATIONS = DEFAULT_CHECK_FOR_DEPRECATED_MESSAGES_TIMEOUT
 
 CACHE_KEY_PREFIX_NOTIFICATION = DEFAULT_CACHE_KEY_PREFIX_NOTIFICATION
+CACHE_KEY_PREFIX_TASK_RESULT = DEFAULT_CACHE_KEY_PREFIX_TASK_RESULT
+
+NOTIFICATIONS_BATCH_SIZE = DEFAULT_NOTIFICATIONS_BATCH_SIZE
+NOTIFICATIONS_CLAIM_TIMEOUT = DEFAULT_NOTIFICATIONS_CLAIM_TIMEOUT
+NOTIFICATIONS_MAX_CONCURRENCY = DEFAULT_NOTIFICATIONS_MAX_CONCURRENCY
+NOTIFICATIONS_MERGE_WINDOW = DEFAULT_NOTIFICATIONS_MERGE_WINDOW
 
 CUSTOM_MESSAGE_MIN_ORDER: int = 100
+
+BACKGROUND_TASKS_DRAIN_TIMEOUT: int = 30
+
+TELEGRAM_MESSAGE_MAX_LENGTH: int = 4096
+NOTIFICATIONS_MERGE_SEPARATOR: str = "\n\n"
+NOTIFICATIONS_RETRY_DELAY: int = 10
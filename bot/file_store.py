@@ -0,0 +1,83 @@
+import logging
+import os
+import sqlite3
+import threading
+from typing import Optional
+
+from settings import DATA_DIRECTORY_ROOT
+
+logger = logging.getLogger("cerrrbot")
+
+BLOBS_DIRECTORY = os.path.join(DATA_DIRECTORY_ROOT, ".blobs")
+BLOBS_TMP_DIRECTORY = os.path.join(BLOBS_DIRECTORY, "tmp")
+BLOBS_INDEX_PATH = os.path.join(BLOBS_DIRECTORY, "index.sqlite3")
+
+_connection: Optional[sqlite3.Connection] = None
+_lock = threading.Lock()
+
+# Files are stored once by content hash in BLOBS_DIRECTORY and linked into
+# human-readable per-user layout, index maps telegram's file_unique_id to blob.
+# All functions are blocking, so they are expected to be run in thread pool.
+
+
+def get_tmp_path(file_unique_id: str) -> str:
+    os.makedirs(BLOBS_TMP_DIRECTORY, exist_ok=True)
+    return os.path.join(BLOBS_TMP_DIRECTORY, file_unique_id)
+
+
+def find_blob(file_unique_id: str) -> Optional[tuple[str, str, int]]:
+    with _lock:
+        row = _get_connection().execute(
+            "SELECT blob_path, sha256, size FROM blobs WHERE file_unique_id = ?",
+            (file_unique_id,),
+        ).fetchone()
+
+    if row and os.path.exists(row[0]):
+        return row
+    return None
+
+
+def store_blob(file_unique_id: str, tmp_path: str, sha256: str, size: int) -> str:
+    blob_path = os.path.join(BLOBS_DIRECTORY, sha256[:2], sha256)
+    if os.path.exists(blob_path):
+        logger.debug("Blob {} already stored, dedup {}".format(sha256, file_unique_id))
+        os.remove(tmp_path)
+    else:
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        os.replace(tmp_path, blob_path)
+
+    with _lock:
+        connection = _get_connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO blobs (file_unique_id, sha256, size, blob_path) VALUES (?, ?, ?, ?)",
+            (file_unique_id, sha256, size, blob_path),
+        )
+        connection.commit()
+    return blob_path
+
+
+def link_blob(blob_path: str, file_path: str) -> None:
+    if os.path.exists(file_path):
+        if os.path.samefile(blob_path, file_path):
+            return
+        os.remove(file_path)
+
+    try:
+        os.link(blob_path, file_path)
+    except OSError:
+        os.symlink(os.path.relpath(blob_path, os.path.dirname(file_path)), file_path)
+
+
+def _get_connection() -> sqlite3.Connection:
+    global _connection
+    if _connection is None:
+        os.makedirs(BLOBS_DIRECTORY, exist_ok=True)
+        _connection = sqlite3.connect(BLOBS_INDEX_PATH, check_same_thread=False)
+        _connection.execute(
+            "CREATE TABLE IF NOT EXISTS blobs ("
+            "file_unique_id TEXT PRIMARY KEY, sha256 TEXT NOT NULL, "
+            "size INTEGER NOT NULL, blob_path TEXT NOT NULL)"
+        )
+        _connection.execute("CREATE INDEX IF NOT EXISTS blobs_sha256 ON blobs (sha256)")
+        _connection.commit()
+    return _connection
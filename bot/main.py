@@ -4,15 +4,26 @@ import asyncio
 import logging
 
 from aiogram import Bot, Dispatcher, F, Router, types
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.filters import Command
+from aiogram.methods import DeleteWebhook
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
 import models
-from common import CheckUserMiddleware
-from constants import CHECK_FOR_NEW_MESSAGES_TIMEOUT, CHECK_FOR_DEPRECATED_MESSAGES_TIMEOUT, CHECK_FOR_NOTIFICATIONS
-from repositories import db
+from common import CheckUserMiddleware, drain_background_tasks
+from constants import (
+    BACKGROUND_TASKS_DRAIN_TIMEOUT,
+    CHECK_FOR_DEPRECATED_MESSAGES_TIMEOUT,
+    CHECK_FOR_NEW_MESSAGES_TIMEOUT,
+)
+from repositories import db, db_async
 from services import savmes, notifications
-from settings import TOKEN, LOGGING_LEVEL
+from settings import TELEGRAM_API_SERVER, TOKEN, LOGGING_LEVEL, UPDATES_MODE, WEBHOOK_URL
+from task_executor import task_executor
+from telegram_gateway import InteractivePriorityMiddleware, telegram_gateway
+from update_lanes import update_lanes
+from webhook import webhook_server
 
 logger = logging.getLogger("cerrrbot")
 logger.setLevel(LOGGING_LEVEL)
@@ -29,14 +40,17 @@ main_router.message.middleware(CheckUserMiddleware())
 
 
 @main_router.message(Command(commands=["start", "menu"]))
-async def main_menu(message: types.Message):
-    await message.answer("Welcome, master")
+async def main_menu(message: types.Message, bot: Bot):
+    await telegram_gateway.call(bot, message.answer("Welcome, master"))
 
 
 async def create_periodic_tasks(bot: Bot) -> None:
+    telegram_gateway.start()
+    await savmes.start_action_timer(bot)
+    savmes.start_task_listener(bot)
+    await notifications.init_notifications(bot)
     scheduler.add_job(savmes.perform_message_actions, "interval", (bot,), seconds=CHECK_FOR_NEW_MESSAGES_TIMEOUT)
     scheduler.add_job(savmes.delete_deprecated_messages, "interval", (bot,), seconds=CHECK_FOR_DEPRECATED_MESSAGES_TIMEOUT)
-    scheduler.add_job(notifications.process_notifications, "interval", (bot,), seconds=CHECK_FOR_NOTIFICATIONS)
     scheduler.start()
 
 scheduler = AsyncIOScheduler()
@@ -44,22 +58,48 @@ scheduler = AsyncIOScheduler()
 
 async def main():
     logger.info("Checking db...")
-    db_info = db.check_connection()
+    db_info = await db_async.check_connection()
     if db_info:
         logger.info("Got db:{}".format(db_info))
-        db.init(models.collections)
+        await db_async.init(models.collections)
     else:
         logger.error("DB is down")
 
     logger.info("Start bot...")
-    bot = Bot(token=TOKEN)
+    session = None
+    if TELEGRAM_API_SERVER:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_SERVER))
+    bot = Bot(token=TOKEN, session=session)
     await create_periodic_tasks(bot)
 
     main_router.include_router(savmes.router)
 
     dp = Dispatcher()
+    dp.update.outer_middleware(update_lanes)
+    dp.update.outer_middleware(InteractivePriorityMiddleware())
     dp.include_router(main_router)
-    await dp.start_polling(bot)
+    try:
+        if UPDATES_MODE == "webhook":
+            await webhook_server.serve(dp, bot, WEBHOOK_URL, BACKGROUND_TASKS_DRAIN_TIMEOUT)
+        else:
+            # getUpdates doesn't work while webhook is set
+            await telegram_gateway.call(bot, DeleteWebhook())
+            # update lanes return as soon as update is queued and block when too many are
+            await dp.start_polling(bot, handle_as_tasks=False)
+    finally:
+        await update_lanes.stop(timeout=BACKGROUND_TASKS_DRAIN_TIMEOUT)
+        scheduler.shutdown(wait=False)
+        await savmes.action_timer.stop()
+        await savmes.task_listener.stop()
+        await notifications.dispatcher.stop()
+        await savmes.action_jobs.stop(timeout=BACKGROUND_TASKS_DRAIN_TIMEOUT)
+        await drain_background_tasks(timeout=BACKGROUND_TASKS_DRAIN_TIMEOUT)
+        await savmes.keyboard_edits.stop()
+        await telegram_gateway.stop(timeout=BACKGROUND_TASKS_DRAIN_TIMEOUT)
+        task_executor.shutdown()
+        await bot.session.close()
+        db.close()
+        db_async.close()
 
 
 if __name__ == "__main__":
@@ -1,35 +1,57 @@
 from typing import Any, Optional
 
+from pymongo import IndexModel
+
 from common import AppResult
-from repositories import db
+from repositories import db_async
 
 
 class CollectionModel:
     name: str
     ttl: Optional[int] = 0
+    indexes: tuple[IndexModel, ...] = ()
+
+    @classmethod
+    async def add_document(cls, entry_data: dict[str, Any]) -> AppResult:
+        return await db_async.insert(cls.name, entry_data)
 
     @classmethod
-    def add_document(cls, entry_data: dict[str, Any]) -> AppResult:
-        return db.insert(cls.name, entry_data)
+    async def update_document(
+        cls,
+        entry_id: str,
+        new_values: dict[str, Any],
+        unset_values: Optional[dict[str, Any]] = None,
+    ) -> AppResult:
+        return await db_async.update(cls.name, entry_id, new_values, unset_values)
 
     @classmethod
-    def update_document(cls, entry_id: str, new_values: dict[str, Any]) -> AppResult:
-        return db.update(cls.name, entry_id, new_values)
+    async def add_documents(cls, entries_data: list[dict[str, Any]]) -> AppResult:
+        return await db_async.insert_many(cls.name, entries_data)
 
     @classmethod
-    def get_document(cls, entry_id: str) -> Optional[dict]:
-        result = db.select(cls.name, entry_id)
+    async def update_documents(
+        cls, updates: list[tuple[str, dict[str, Any], Optional[dict[str, Any]]]]
+    ) -> AppResult:
+        return await db_async.bulk_update(cls.name, updates)
+
+    @classmethod
+    async def get_document(cls, entry_id: str) -> Optional[dict]:
+        result = await db_async.select(cls.name, entry_id)
         return result[0] if result else None
 
     @classmethod
-    def del_document(cls, _id: str) -> AppResult:
-        return db.delete_many(cls.name, [_id])
+    async def del_document(cls, _id: str) -> AppResult:
+        return await db_async.delete_many(cls.name, [_id])
+
+    @classmethod
+    async def del_documents(cls, ids: list[str]) -> AppResult:
+        return await db_async.delete_many(cls.name, ids)
 
     @classmethod
-    def exists_document_in_group(cls, key, value) -> bool:
-        return db.count(cls.name, filter_={key: value}) > 1
+    async def exists_document_in_group(cls, key, value) -> bool:
+        return await db_async.count(cls.name, filter_={key: value}) > 1
 
     @classmethod
-    def get_documents_by_filter(cls, filter_) -> list:
-        return db.select(cls.name, filter_=filter_)
+    async def get_documents_by_filter(cls, filter_) -> list:
+        return await db_async.select(cls.name, filter_=filter_)
 
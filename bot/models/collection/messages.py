@@ -1,21 +1,64 @@
 from typing import Any
 
+from pymongo import ASCENDING, IndexModel
+
 from common import AppResult
+from repositories import db_async
 from .base import CollectionModel
 
+MESSAGE_INDEXES = (
+    IndexModel([("date", ASCENDING)], name="date"),
+    IndexModel(
+        [("media_group_id", ASCENDING)],
+        name="media_group_id",
+        partialFilterExpression={"media_group_id": {"$exists": True}},
+    ),
+)
+
 
 class NewMessagesCollection(CollectionModel):
     name = "new_messages"
+    indexes = (
+        *MESSAGE_INDEXES,
+        IndexModel(
+            [("cb_message_info.perform_action_at", ASCENDING)],
+            name="perform_action_at",
+            partialFilterExpression={"cb_message_info.perform_action_at": {"$gt": 0}},
+        ),
+    )
+
+    @classmethod
+    async def get_scheduled_actions(cls) -> list[tuple[str, int]]:
+        documents = await db_async.select(
+            cls.name,
+            filter_={"cb_message_info.perform_action_at": {"$gt": 0}},
+            projection={"cb_message_info.perform_action_at": True},
+        )
+        return [
+            (str(document["_id"]), document["cb_message_info"]["perform_action_at"])
+            for document in documents
+        ]
 
 
 class SavedMessagesCollection(CollectionModel):
     name = "saved_messages"
+    indexes = MESSAGE_INDEXES
 
     @classmethod
-    def add_document(cls, entry_data: dict[str, Any]) -> AppResult:
+    async def add_document(cls, entry_data: dict[str, Any]) -> AppResult:
         if not entry_data.get("_id"):
             return AppResult(
                 False, "Invalid new entry_data, missed _id field:{}".format(entry_data)
             )
 
-        return super().add_document(entry_data)
+        return await super().add_document(entry_data)
+
+    @classmethod
+    async def add_documents(cls, entries_data: list[dict[str, Any]]) -> AppResult:
+        invalid_entries = [entry_data for entry_data in entries_data if not entry_data.get("_id")]
+        if invalid_entries:
+            return AppResult(
+                False, "Invalid new entries_data, missed _id field:{}".format(invalid_entries)
+            )
+
+        return await super().add_documents(entries_data)
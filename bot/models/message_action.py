@@ -1,9 +1,10 @@
-import re
-from typing import Any
+from typing import Any, Optional
 
-from pydantic import BaseModel, Field
+import regex
+from pydantic import BaseModel, Field, PrivateAttr
 
 from constants import CUSTOM_MESSAGE_MIN_ORDER
+from settings import REGEX_MATCH_TIMEOUT
 
 
 class MessageAction(BaseModel):
@@ -25,25 +26,50 @@ class CustomMessageAction(MessageAction):
     order: int = Field(gt=CUSTOM_MESSAGE_MIN_ORDER)
     method: str = "custom_task"
 
+    _pattern: Optional[regex.Pattern] = PrivateAttr(default=None)
+    _pattern_error: Optional[str] = PrivateAttr(default=None)
+
     def __init__(self, **data):
         data["method_args"]["code"] = data["code"]
         super().__init__(**data)
+        if self.regex_pattern and self.regex_pattern != "*":
+            # `regex` is compatible with `re`, but matching can be interrupted by timeout
+            try:
+                self._pattern = regex.compile(self.regex_pattern, regex.IGNORECASE)
+            except regex.error as exc:
+                self._pattern_error = str(exc)
+
+    @property
+    def regex_pattern(self) -> Optional[str]:
+        return self.method_args.get("regex")
+
+    @property
+    def pattern(self) -> Optional[regex.Pattern]:
+        return self._pattern
 
-    def parse(self, text: str, links: list[str]) -> list[str]:
+    @property
+    def pattern_error(self) -> Optional[str]:
+        return self._pattern_error
+
+    def find_all(self, text: str, timeout: float = REGEX_MATCH_TIMEOUT) -> list[str]:
+        # raises TimeoutError if pattern takes too long
+        return [data.group() for data in self._pattern.finditer(text, timeout=timeout)]
+
+    def parse(self, text: str, links: list[str], matches: Optional[list[str]] = None) -> list[str]:
+        # `matches` of regex may be found beforehand, e.g. by matcher of all actions at once
         parsed_data = []
         if self.method_args.get("parse_text_links"):
             parsed_data = list(links)
 
-        regex_pattern = self.method_args.get("regex")
-        if not regex_pattern:
+        if not self.regex_pattern or not text:
             return parsed_data
-        elif regex_pattern == "*":
+        elif self.regex_pattern == "*":
             parsed_data.append(text)
             return parsed_data
+        elif self._pattern is None:
+            return parsed_data
 
-        regex = re.compile(regex_pattern, re.IGNORECASE)
-        for data in regex.finditer(text):
-            parsed = data.group()
-            if parsed:
-                parsed_data.append(parsed)
+        if matches is None:
+            matches = self.find_all(text)
+        parsed_data.extend(parsed for parsed in matches if parsed)
         return parsed_data
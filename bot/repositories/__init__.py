@@ -1,5 +1,6 @@
 from . import mongo as db
+from . import mongo_async as db_async
 from . import redis as cache
 
 
-__all__ = ("db", "cache")
\ No newline at end of file
+__all__ = ("db", "db_async", "cache")
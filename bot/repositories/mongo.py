@@ -1,17 +1,35 @@
 import logging
+import os
+import threading
+import time
 from typing import Any, Iterable, Optional
 
 import bson
 import pymongo
+from pymongo import monitoring
 from pymongo.errors import ServerSelectionTimeoutError
 from bson.objectid import ObjectId
-from settings import MONGO_DB_HOST, MONGO_DB_NAME, MONGO_DB_PORT
+from settings import (
+    MONGO_CONNECT_TIMEOUT_MS,
+    MONGO_DB_HOST,
+    MONGO_DB_NAME,
+    MONGO_DB_PORT,
+    MONGO_MAX_IDLE_TIME_MS,
+    MONGO_MAX_POOL_SIZE,
+    MONGO_MIN_POOL_SIZE,
+    MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    MONGO_WAIT_QUEUE_TIMEOUT_MS,
+)
 
 from common import AppResult
 
 
 logger = logging.getLogger("cerrrbot")
 
+_client: Optional[pymongo.MongoClient] = None
+_client_pid: Optional[int] = None
+_client_lock = threading.Lock()
+
 
 def init(collections: Iterable):
     logger.info("Starting init DB...")
@@ -59,15 +77,22 @@ def insert(collection_name: str, entry_data: dict[str, Any]) -> AppResult:
     return AppResult(True, data={"_id": str(inserted_id)})
 
 
-def update(collection_name: str, entry_id: str, new_values: dict[str, Any]) -> AppResult:
-    if not new_values:
+def update(
+    collection_name: str,
+    entry_id: str,
+    new_values: dict[str, Any],
+    unset_values: Optional[dict[str, Any]] = None,
+) -> AppResult:
+    if not new_values and not unset_values:
         return AppResult()
 
     db = get_mongo_db()
     collection = db[collection_name]
 
     try:
-        result = collection.update_one({"_id": _document_id(entry_id)}, {"$set": new_values})
+        result = collection.update_one(
+            {"_id": _document_id(entry_id)}, _update_operations(new_values, unset_values)
+        )
     except Exception as exc:
         return AppResult(False, exc)
 
@@ -102,6 +127,17 @@ def count(collection_name: str, filter_: dict[str, Any] | None = None) -> int:
         return collection.count_documents()
 
 
+def _update_operations(
+    new_values: Optional[dict[str, Any]], unset_values: Optional[dict[str, Any]]
+) -> dict[str, Any]:
+    operations = {}
+    if new_values:
+        operations["$set"] = new_values
+    if unset_values:
+        operations["$unset"] = unset_values
+    return operations
+
+
 def _document_id(entry_id: Any) -> ObjectId:
     try:
         _id = ObjectId(entry_id)
@@ -125,10 +161,138 @@ def get_mongo_db():
     return client[MONGO_DB_NAME]
 
 
-def _get_client():
-    return pymongo.MongoClient(
-        MONGO_DB_HOST,
-        MONGO_DB_PORT,
-        serverSelectionTimeoutMS=2000,
-        connectTimeoutMS=15000,
-    )
+def close() -> None:
+    global _client, _client_pid
+    with _client_lock:
+        if _client is not None and _client_pid == os.getpid():
+            logger.info("Closing mongo client, pool stats: {}".format(pool_stats.as_dict()))
+            _client.close()
+        _client = None
+        _client_pid = None
+
+
+def get_pool_stats() -> dict[str, Any]:
+    return pool_stats.as_dict()
+
+
+def client_options() -> dict[str, Any]:
+    return {
+        "host": MONGO_DB_HOST,
+        "port": MONGO_DB_PORT,
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": MONGO_MAX_IDLE_TIME_MS,
+        "waitQueueTimeoutMS": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+        "event_listeners": [pool_stats],
+    }
+
+
+def _get_client() -> pymongo.MongoClient:
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+
+    with _client_lock:
+        if _client is None or _client_pid != pid:
+            # client inherited from parent process must not be reused after fork
+            _client = pymongo.MongoClient(**client_options())
+            _client_pid = pid
+            logger.debug("Created mongo client for process: {}".format(pid))
+    return _client
+
+
+def _reset_after_fork() -> None:
+    global _client, _client_pid, _client_lock
+    _client = None
+    _client_pid = None
+    _client_lock = threading.Lock()
+    pool_stats.reset()
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self) -> None:
+        self.connections_open = 0
+        self.checked_out = 0
+        self.max_checked_out = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+        self.pools_cleared = 0
+
+    def as_dict(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "max_pool_size": MONGO_MAX_POOL_SIZE,
+                "connections_open": self.connections_open,
+                "checked_out": self.checked_out,
+                "max_checked_out": self.max_checked_out,
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "avg_wait_time": self.total_wait_time / self.checkouts if self.checkouts else 0.0,
+                "max_wait_time": self.max_wait_time,
+                "pools_cleared": self.pools_cleared,
+            }
+
+    def connection_check_out_started(self, event) -> None:
+        self._local.started_at = time.monotonic()
+
+    def connection_checked_out(self, event) -> None:
+        wait_time = self._pop_wait_time()
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+            self.total_wait_time += wait_time
+            self.max_wait_time = max(self.max_wait_time, wait_time)
+
+    def connection_check_out_failed(self, event) -> None:
+        self._pop_wait_time()
+        with self._lock:
+            self.checkout_failures += 1
+        logger.warning("Mongo connection checkout failed: {}".format(event.reason))
+
+    def connection_checked_in(self, event) -> None:
+        with self._lock:
+            self.checked_out -= 1
+
+    def connection_created(self, event) -> None:
+        with self._lock:
+            self.connections_open += 1
+
+    def connection_closed(self, event) -> None:
+        with self._lock:
+            self.connections_open -= 1
+
+    def connection_ready(self, event) -> None:
+        pass
+
+    def pool_created(self, event) -> None:
+        pass
+
+    def pool_ready(self, event) -> None:
+        pass
+
+    def pool_cleared(self, event) -> None:
+        with self._lock:
+            self.pools_cleared += 1
+
+    def pool_closed(self, event) -> None:
+        pass
+
+    def _pop_wait_time(self) -> float:
+        started_at = getattr(self._local, "started_at", None)
+        self._local.started_at = None
+        return time.monotonic() - started_at if started_at is not None else 0.0
+
+
+pool_stats = PoolStats()
+os.register_at_fork(after_in_child=_reset_after_fork)
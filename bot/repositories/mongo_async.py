@@ -0,0 +1,265 @@
+import logging
+import os
+from typing import Any, Iterable, Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import IndexModel, UpdateOne
+from pymongo.errors import ServerSelectionTimeoutError
+from settings import MONGO_DB_NAME
+
+from common import AppResult
+
+from .mongo import _document_id, _update_operations, client_options, pool_stats
+
+
+logger = logging.getLogger("cerrrbot")
+
+_client: Optional[AsyncIOMotorClient] = None
+_client_pid: Optional[int] = None
+
+
+async def init(collections: Iterable):
+    logger.info("Starting init DB...")
+    db = get_mongo_db()
+    existing_collections = await db.list_collection_names()
+    if existing_collections:
+        logger.info(
+            "DB already initialized with next collections:{}".format(existing_collections)
+        )
+
+    for collection_config in collections:
+        if collection_config.name not in existing_collections:
+            await db.create_collection(collection_config.name)
+        await ensure_indexes(collection_config.name, collection_config.indexes)
+
+
+async def ensure_indexes(collection_name: str, indexes: Iterable[IndexModel]) -> AppResult:
+    collection = get_mongo_db()[collection_name]
+    existing_indexes = await collection.index_information()
+    declared_indexes = {index.document["name"]: index for index in indexes}
+
+    to_create = []
+    for name, index in declared_indexes.items():
+        existing_index = existing_indexes.get(name)
+        if existing_index is None:
+            logger.info("[{}] Missing index: {}".format(collection_name, name))
+            to_create.append(index)
+        elif not _is_same_index(index.document, existing_index):
+            logger.warning(
+                "[{}] Index {} differs from declared one, recreating it".format(
+                    collection_name, name
+                )
+            )
+            await collection.drop_index(name)
+            to_create.append(index)
+
+    try:
+        if to_create:
+            await collection.create_indexes(to_create)
+    except Exception as exc:
+        logger.exception(exc)
+        return AppResult(False, exc)
+
+    undeclared = [
+        name for name in existing_indexes if name != "_id_" and name not in declared_indexes
+    ]
+    if undeclared:
+        logger.warning("[{}] Undeclared indexes: {}".format(collection_name, undeclared))
+
+    unused = [
+        name for name, ops in (await _get_indexes_usage(collection)).items()
+        if name != "_id_" and not ops
+    ]
+    if unused:
+        logger.info("[{}] Unused since server start indexes: {}".format(collection_name, unused))
+
+    return AppResult(
+        data={
+            "created": [index.document["name"] for index in to_create],
+            "undeclared": undeclared,
+            "unused": unused,
+        }
+    )
+
+
+def _is_same_index(declared: dict[str, Any], existing: dict[str, Any]) -> bool:
+    return (
+        list(declared["key"].items()) == list(existing["key"])
+        and declared.get("partialFilterExpression") == existing.get("partialFilterExpression")
+        and bool(declared.get("unique")) == bool(existing.get("unique"))
+    )
+
+
+async def _get_indexes_usage(collection) -> dict[str, int]:
+    try:
+        stats = await collection.aggregate([{"$indexStats": {}}]).to_list(length=None)
+    except Exception as exc:
+        logger.warning("Couldn't get indexes usage: {}".format(exc))
+        return {}
+
+    return {stat["name"]: stat["accesses"]["ops"] for stat in stats}
+
+
+async def select(
+    collection_name: str,
+    entry_id: Optional[str] = None,
+    filter_: Optional[dict] = None,
+    projection: Optional[dict] = None,
+) -> list:
+    db = get_mongo_db()
+    collection = db[collection_name]
+
+    documents = []
+    if entry_id is not None:
+        document = await collection.find_one(_document_id(entry_id), projection)
+        if document:
+            documents.append(document)
+
+    if filter_ is not None:
+        documents_filter = await collection.find(filter_, projection).to_list(length=None)
+        if documents_filter:
+            documents.extend(documents_filter)
+
+    return documents
+
+
+async def insert(collection_name: str, entry_data: dict[str, Any]) -> AppResult:
+    db = get_mongo_db()
+    collection = db[collection_name]
+
+    entry_data["_id"] = _document_id(entry_data.get("_id"))
+
+    try:
+        inserted_id = (await collection.insert_one(entry_data)).inserted_id
+    except Exception as exc:
+        return AppResult(False, exc)
+
+    return AppResult(True, data={"_id": str(inserted_id)})
+
+
+async def update(
+    collection_name: str,
+    entry_id: str,
+    new_values: dict[str, Any],
+    unset_values: Optional[dict[str, Any]] = None,
+) -> AppResult:
+    if not new_values and not unset_values:
+        return AppResult()
+
+    db = get_mongo_db()
+    collection = db[collection_name]
+
+    try:
+        result = await collection.update_one(
+            {"_id": _document_id(entry_id)}, _update_operations(new_values, unset_values)
+        )
+    except Exception as exc:
+        return AppResult(False, exc)
+
+    if result.modified_count != 1:
+        return AppResult(False, "None of documents not modified")
+
+    return AppResult(True)
+
+
+async def insert_many(collection_name: str, entries_data: list[dict[str, Any]]) -> AppResult:
+    if not entries_data:
+        return AppResult(data={"_ids": []})
+
+    db = get_mongo_db()
+    collection = db[collection_name]
+
+    for entry_data in entries_data:
+        entry_data["_id"] = _document_id(entry_data.get("_id"))
+
+    try:
+        inserted_ids = (await collection.insert_many(entries_data, ordered=False)).inserted_ids
+    except Exception as exc:
+        return AppResult(False, exc)
+
+    return AppResult(True, data={"_ids": [str(_id) for _id in inserted_ids]})
+
+
+async def bulk_update(
+    collection_name: str,
+    updates: list[tuple[str, dict[str, Any], Optional[dict[str, Any]]]],
+) -> AppResult:
+    operations = [
+        UpdateOne({"_id": _document_id(entry_id)}, _update_operations(new_values, unset_values))
+        for entry_id, new_values, unset_values in updates
+        if new_values or unset_values
+    ]
+    if not operations:
+        return AppResult()
+
+    db = get_mongo_db()
+    collection = db[collection_name]
+
+    try:
+        result = await collection.bulk_write(operations, ordered=False)
+    except Exception as exc:
+        return AppResult(False, exc)
+
+    if result.modified_count != len(operations):
+        return AppResult(
+            False, "Modified {} of {} documents".format(result.modified_count, len(operations))
+        )
+
+    return AppResult(True)
+
+
+async def delete_many(collection_name: str, entities_ids: list[str]) -> AppResult:
+    db = get_mongo_db()
+    collection = db[collection_name]
+
+    documents_ids = [_document_id(_id) for _id in entities_ids]
+
+    try:
+        deleted_count = (
+            await collection.delete_many({"_id": {"$in": documents_ids}})
+        ).deleted_count
+    except Exception as exc:
+        return AppResult(False, exc)
+
+    return AppResult(deleted_count == len(entities_ids))
+
+
+async def count(collection_name: str, filter_: dict[str, Any] | None = None) -> int:
+    db = get_mongo_db()
+    collection = db[collection_name]
+    return await collection.count_documents(filter_ or {})
+
+
+async def check_connection() -> bool:
+    client = _get_client()
+
+    try:
+        return await client.server_info()
+    except ServerSelectionTimeoutError:
+        return False
+
+
+def get_mongo_db():
+    client = _get_client()
+    return client[MONGO_DB_NAME]
+
+
+def close() -> None:
+    global _client, _client_pid
+    if _client is not None and _client_pid == os.getpid():
+        logger.info("Closing async mongo client, pool stats: {}".format(pool_stats.as_dict()))
+        _client.close()
+    _client = None
+    _client_pid = None
+
+
+def _get_client() -> AsyncIOMotorClient:
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        # motor client binds to the running event loop on first use,
+        # so it's created lazily from the coroutines above
+        _client = AsyncIOMotorClient(**client_options())
+        _client_pid = pid
+        logger.debug("Created async mongo client for process: {}".format(pid))
+    return _client
@@ -1,9 +1,10 @@
 
 from redis import asyncio as aioredis
 
-from settings import REDIS_HOST, REDIS_PORT, REDIS_NOTIFICATIONS_DB_IDX
+from settings import REDIS_BACKEND_DB_IDX, REDIS_HOST, REDIS_PORT, REDIS_NOTIFICATIONS_DB_IDX
 
 _redis = None
+_redis_backend = None
 
 
 async def get_client():
@@ -11,3 +12,11 @@ async def get_client():
     if _redis is None:
         _redis = await aioredis.from_url(f"redis://{REDIS_HOST}:{REDIS_PORT}/{REDIS_NOTIFICATIONS_DB_IDX}")
     return _redis
+
+
+async def get_backend_client():
+    # celery results backend, used to track tasks without blocking calls
+    global _redis_backend
+    if _redis_backend is None:
+        _redis_backend = await aioredis.from_url(f"redis://{REDIS_HOST}:{REDIS_PORT}/{REDIS_BACKEND_DB_IDX}")
+    return _redis_backend
@@ -1,7 +1,10 @@
-from .api import process_notifications, push_message_notification
+from .api import init_notifications, process_notifications, push_message_notification
+from .dispatcher import dispatcher
 from .notification import Notification
 
 __all__ = (
+    "dispatcher",
+    "init_notifications",
     "process_notifications",
     "push_message_notification",
     "Notification"
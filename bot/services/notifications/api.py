@@ -1,69 +1,158 @@
+import asyncio
 import logging
-from datetime import datetime
-from math import inf
-
-from uuid import uuid4
+from collections import defaultdict
 
 from aiogram import Bot
+from aiogram.methods import SendMessage
 
 from common import AppResult
-from constants import CACHE_KEY_PREFIX_NOTIFICATION
-from repositories import cache
-
-from .notification import Notification
+from constants import (
+    NOTIFICATIONS_MAX_CONCURRENCY,
+    NOTIFICATIONS_MERGE_SEPARATOR,
+    NOTIFICATIONS_MERGE_WINDOW,
+    TELEGRAM_MESSAGE_MAX_LENGTH,
+)
+from telegram_gateway import telegram_gateway
+
+from . import storage
+from .dispatcher import dispatcher
+from .notification import Notification, utc_timestamp
 
 logger = logging.getLogger("cerrrbot")
 
 
 async def push_message_notification(notification: Notification) -> AppResult:
-    key = f"{CACHE_KEY_PREFIX_NOTIFICATION}:{uuid4()}"
     try:
-        client = await cache.get_client()
-        await client.set(key, notification.model_dump())
+        key = await storage.push(notification)
     except Exception as exc:
         logger.exception(exc)
         return AppResult(False, exc)
 
     logger.info(f"Notification pushed: {key}")
+    if dispatcher.running:
+        dispatcher.wake()
     return AppResult()
 
 
-CACHE_KEY_PATTERN = f"{CACHE_KEY_PREFIX_NOTIFICATION}:*"
+async def init_notifications(bot: Bot) -> None:
+    await storage.index_legacy_notifications()
+    dispatcher.start(lambda: process_notifications(bot))
 
 
 async def process_notifications(bot: Bot):
-    client = await cache.get_client()
-    async for key in client.scan_iter(CACHE_KEY_PATTERN):
-        logger.info(f"Got notification: {key}")
-        notification_data = await client.get(key)
-        notification: Notification = Notification.model_load(Notification, notification_data)
+    await storage.requeue_expired_claims()
+    claimed = await storage.claim_due()
+    if not claimed:
+        return
 
+    acked, by_chat = [], defaultdict(list)
+    for key, notification in claimed:
+        logger.info(f"Got notification: {key}")
         if notification.need_send():
-            result = await send_notification_message(bot, notification)
-            if result and notification.need_repeat():
-                result = await repeat_push(notification)
-            if result:
-                await client.delete(key)
+            by_chat[notification.chat_id].append((key, notification))
+        else:
+            acked.append(key)
+
+    semaphore = asyncio.Semaphore(NOTIFICATIONS_MAX_CONCURRENCY)
+    results = await asyncio.gather(
+        *(
+            _send_chat_notifications(bot, chat_notifications, semaphore)
+            for chat_notifications in by_chat.values()
+        )
+    )
+
+    released, repeated = [], []
+    for chat_acked, chat_released, chat_repeated in results:
+        acked.extend(chat_acked)
+        released.extend(chat_released)
+        repeated.extend(chat_repeated)
+
+    await storage.finish(acked, released, repeated)
+    if released:
+        logger.warning("Failed to send {} notifications, released them".format(len(released)))
+
+
+async def _send_chat_notifications(
+    bot: Bot,
+    chat_notifications: list[tuple[str, Notification]],
+    semaphore: asyncio.Semaphore,
+) -> tuple[list[str], list[str], list[Notification]]:
+    acked, released, repeated = [], [], []
+    async with semaphore:
+        # messages within chat are sent in order, so merged ones aren't reordered
+        for batch in merge_notifications(chat_notifications):
+            keys = [key for key, _ in batch]
+            if released:
+                released.extend(keys)
+                continue
+
+            result = await send_notification_message(bot, _merged_notification(batch))
+            if not result:
+                released.extend(keys)
+                continue
+
+            acked.extend(keys)
+            repeated.extend(
+                get_repeated_notification(notification)
+                for _, notification in batch
+                if notification.need_repeat()
+            )
+    return acked, released, repeated
+
+
+def merge_notifications(
+    chat_notifications: list[tuple[str, Notification]]
+) -> list[list[tuple[str, Notification]]]:
+    batches = []
+    batch, batch_length = [], 0
+    for key, notification in sorted(chat_notifications, key=lambda item: item[1].send_at):
+        length = len(notification.text) + len(NOTIFICATIONS_MERGE_SEPARATOR)
+        if batch and (
+            notification.send_at - batch[0][1].send_at > NOTIFICATIONS_MERGE_WINDOW
+            or batch_length + length > TELEGRAM_MESSAGE_MAX_LENGTH
+        ):
+            batches.append(batch)
+            batch, batch_length = [], 0
+        batch.append((key, notification))
+        batch_length += length
+
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def _merged_notification(batch: list[tuple[str, Notification]]) -> Notification:
+    if len(batch) == 1:
+        return batch[0][1]
+
+    notifications = [notification for _, notification in batch]
+    reply_to = {notification.reply_to_message_id for notification in notifications}
+    return notifications[0].copy_with(
+        text=NOTIFICATIONS_MERGE_SEPARATOR.join(n.text for n in notifications),
+        reply_to_message_id=reply_to.pop() if len(reply_to) == 1 else None,
+    )
 
 
-async def repeat_push(notification: Notification) -> AppResult:
-    new_notificaton = notification.copy_with(
-        send_at=int(datetime.utcnow().timestamp()) + notification.repeat_in,
+def get_repeated_notification(notification: Notification) -> Notification:
+    return notification.copy_with(
+        send_at=utc_timestamp() + notification.repeat_in,
         send_count=notification.send_count - 1
     )
-    result = await push_message_notification(new_notificaton)
-    return result
 
 
 async def send_notification_message(bot: Bot, notification: Notification) -> AppResult:
     try:
-        await bot.send_message(
-            chat_id=notification.chat_id,
-            text=notification.text,
-            reply_to_message_id=notification.reply_to_message_id
+        # sends are paced by gateway, so burst of due notifications doesn't hit flood limits
+        await telegram_gateway.call(
+            bot,
+            SendMessage(
+                chat_id=notification.chat_id,
+                text=notification.text,
+                reply_to_message_id=notification.reply_to_message_id,
+            ),
         )
     except Exception as exc:
         logger.exception(exc)
         return AppResult(False, exc)
 
-    return AppResult
+    return AppResult()
@@ -0,0 +1,85 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+
+from constants import CHECK_FOR_NOTIFICATIONS
+from repositories import cache
+
+from . import storage
+from .notification import utc_time
+
+logger = logging.getLogger("cerrrbot")
+
+
+class NotificationDispatcher:
+    # sleeps until the earliest `send_at` from due index, pushes wake it up earlier:
+    # local ones directly, ones from other processes (e.g. plugins in celery) via pub/sub;
+    # CHECK_FOR_NOTIFICATIONS only bounds the sleep in case some wakeup was lost
+    def __init__(self):
+        self._wakeup = asyncio.Event()
+        self._handler: Optional[Callable[[], Awaitable]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._listener_task: Optional[asyncio.Task] = None
+
+    def wake(self) -> None:
+        self._wakeup.set()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self, handler: Callable[[], Awaitable]) -> None:
+        self._handler = handler
+        self._task = asyncio.create_task(self._run())
+        self._listener_task = asyncio.create_task(self._listen())
+        logger.info("Notification dispatcher started")
+
+    async def stop(self) -> None:
+        tasks = [task for task in (self._task, self._listener_task) if task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = self._listener_task = None
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            try:
+                await self._handler()
+                timeout = await self._get_timeout()
+            except Exception as exc:
+                logger.exception("Failed to process notifications: {}".format(exc))
+                timeout = CHECK_FOR_NOTIFICATIONS
+
+            if timeout > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _get_timeout(self) -> float:
+        next_due_at = await storage.get_next_due_at()
+        if next_due_at is None:
+            return CHECK_FOR_NOTIFICATIONS
+        return min(max(next_due_at - utc_time(), 0), CHECK_FOR_NOTIFICATIONS)
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                client = await cache.get_client()
+                pubsub = client.pubsub(ignore_subscribe_messages=True)
+                try:
+                    await pubsub.subscribe(storage.WAKEUP_CHANNEL)
+                    async for _ in pubsub.listen():
+                        self.wake()
+                finally:
+                    await pubsub.reset()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning("Notifications wakeup listener failed: {}".format(exc))
+                self.wake()
+                await asyncio.sleep(CHECK_FOR_NOTIFICATIONS)
+
+
+dispatcher = NotificationDispatcher()
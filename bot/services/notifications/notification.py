@@ -23,9 +23,19 @@ class Notification(BaseModel):
         data = json.loads(data.decode())
         return cls(**data)
     
+    def copy_with(self, **values) -> Self:
+        return self.copy(update=values)
+
     def need_repeat(self) -> bool:
         return self.repeat_in > 0 and self.send_count > 1
 
     def need_send(self) -> bool:
-        now_tstamp = int(datetime.utcnow().timestamp())
-        return self.send_count > 0 and now_tstamp >= self.send_at
\ No newline at end of file
+        return self.send_count > 0 and utc_timestamp() >= self.send_at
+
+
+def utc_time() -> float:
+    return datetime.utcnow().timestamp()
+
+
+def utc_timestamp() -> int:
+    return int(utc_time())
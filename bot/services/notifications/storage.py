@@ -0,0 +1,162 @@
+import logging
+from typing import Optional
+from uuid import uuid4
+
+from constants import (
+    CACHE_KEY_PREFIX_NOTIFICATION,
+    NOTIFICATIONS_BATCH_SIZE,
+    NOTIFICATIONS_CLAIM_TIMEOUT,
+    NOTIFICATIONS_RETRY_DELAY,
+)
+from repositories import cache
+
+from .notification import Notification, utc_timestamp
+
+logger = logging.getLogger("cerrrbot")
+
+# payloads are kept in string keys, due index is sorted set of these keys scored by `send_at`;
+# claimed notifications are moved to another sorted set scored by claim expiration,
+# so ones lost by crashed dispatcher are returned to due index later
+DUE_INDEX_KEY = f"{CACHE_KEY_PREFIX_NOTIFICATION}_due"
+CLAIMED_INDEX_KEY = f"{CACHE_KEY_PREFIX_NOTIFICATION}_claimed"
+CACHE_KEY_PATTERN = f"{CACHE_KEY_PREFIX_NOTIFICATION}:*"
+WAKEUP_CHANNEL = f"{CACHE_KEY_PREFIX_NOTIFICATION}_wakeup"
+
+_CLAIM_DUE_SCRIPT = """
+local keys = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+local claimed = {}
+for _, key in ipairs(keys) do
+    redis.call('ZREM', KEYS[1], key)
+    local payload = redis.call('GET', key)
+    if payload then
+        redis.call('ZADD', KEYS[2], ARGV[3], key)
+        table.insert(claimed, key)
+        table.insert(claimed, payload)
+    end
+end
+return claimed
+"""
+
+_REQUEUE_EXPIRED_SCRIPT = """
+local keys = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+for _, key in ipairs(keys) do
+    redis.call('ZREM', KEYS[2], key)
+    redis.call('ZADD', KEYS[1], ARGV[1], key)
+end
+return #keys
+"""
+
+
+def new_key() -> str:
+    return f"{CACHE_KEY_PREFIX_NOTIFICATION}:{uuid4()}"
+
+
+async def push(notification: Notification, key: Optional[str] = None) -> str:
+    key = key or new_key()
+    client = await cache.get_client()
+    async with client.pipeline(transaction=True) as pipe:
+        pipe.set(key, notification.model_dump())
+        pipe.zadd(DUE_INDEX_KEY, {key: notification.send_at})
+        pipe.publish(WAKEUP_CHANNEL, notification.send_at)
+        await pipe.execute()
+    return key
+
+
+async def claim_due(limit: int = NOTIFICATIONS_BATCH_SIZE) -> list[tuple[str, Notification]]:
+    client = await cache.get_client()
+    now = utc_timestamp()
+    claimed = await client.register_script(_CLAIM_DUE_SCRIPT)(
+        keys=[DUE_INDEX_KEY, CLAIMED_INDEX_KEY],
+        args=[now, limit, now + NOTIFICATIONS_CLAIM_TIMEOUT],
+    )
+
+    notifications = []
+    for key, payload in zip(claimed[::2], claimed[1::2]):
+        key = key.decode() if isinstance(key, bytes) else key
+        try:
+            notifications.append((key, Notification.model_load(Notification, payload)))
+        except Exception as exc:
+            logger.error("Invalid notification {} dropped: {}".format(key, exc))
+            await ack(key)
+    return notifications
+
+
+async def ack(key: str) -> None:
+    client = await cache.get_client()
+    async with client.pipeline(transaction=True) as pipe:
+        pipe.delete(key)
+        pipe.zrem(CLAIMED_INDEX_KEY, key)
+        await pipe.execute()
+
+
+async def release(key: str) -> None:
+    client = await cache.get_client()
+    async with client.pipeline(transaction=True) as pipe:
+        pipe.zrem(CLAIMED_INDEX_KEY, key)
+        pipe.zadd(DUE_INDEX_KEY, {key: utc_timestamp() + NOTIFICATIONS_RETRY_DELAY})
+        await pipe.execute()
+
+
+async def finish(
+    acked: list[str], released: list[str], repeated: list[Notification]
+) -> list[str]:
+    # results of whole dispatched batch are written within one round trip
+    client = await cache.get_client()
+    now = utc_timestamp()
+    repeated_keys = [new_key() for _ in repeated]
+    async with client.pipeline(transaction=True) as pipe:
+        if acked:
+            pipe.delete(*acked)
+        if acked or released:
+            pipe.zrem(CLAIMED_INDEX_KEY, *acked, *released)
+        if released:
+            pipe.zadd(DUE_INDEX_KEY, {key: now + NOTIFICATIONS_RETRY_DELAY for key in released})
+        for key, notification in zip(repeated_keys, repeated):
+            pipe.set(key, notification.model_dump())
+        if repeated:
+            pipe.zadd(
+                DUE_INDEX_KEY,
+                {key: n.send_at for key, n in zip(repeated_keys, repeated)},
+            )
+        await pipe.execute()
+    return repeated_keys
+
+
+async def get_next_due_at() -> Optional[int]:
+    client = await cache.get_client()
+    due = await client.zrange(DUE_INDEX_KEY, 0, 0, withscores=True)
+    claimed = await client.zrange(CLAIMED_INDEX_KEY, 0, 0, withscores=True)
+    deadlines = [int(score) for _, score in due + claimed]
+    return min(deadlines) if deadlines else None
+
+
+async def requeue_expired_claims() -> int:
+    client = await cache.get_client()
+    requeued = await client.register_script(_REQUEUE_EXPIRED_SCRIPT)(
+        keys=[DUE_INDEX_KEY, CLAIMED_INDEX_KEY], args=[utc_timestamp()]
+    )
+    if requeued:
+        logger.warning("Requeued {} expired notification claims".format(requeued))
+    return requeued
+
+
+async def index_legacy_notifications() -> int:
+    # notifications pushed before due index existed or set manually without it
+    client = await cache.get_client()
+    indexed = 0
+    async for key in client.scan_iter(CACHE_KEY_PATTERN):
+        if await client.zscore(DUE_INDEX_KEY, key) is not None:
+            continue
+        if await client.zscore(CLAIMED_INDEX_KEY, key) is not None:
+            continue
+
+        payload = await client.get(key)
+        if payload is None:
+            continue
+        notification = Notification.model_load(Notification, payload)
+        await client.zadd(DUE_INDEX_KEY, {key: notification.send_at})
+        indexed += 1
+
+    if indexed:
+        logger.info("Indexed {} notifications without due index".format(indexed))
+    return indexed
@@ -1 +1,11 @@
-from .commands import router, perform_message_actions, delete_deprecated_messages  # noqa: F401
+from .action_jobs import action_jobs  # noqa: F401
+from .action_timer import action_timer  # noqa: F401
+from .commands import (  # noqa: F401
+    delete_deprecated_messages,
+    perform_message_actions,
+    router,
+    start_action_timer,
+    start_task_listener,
+)
+from .keyboard_edits import keyboard_edits  # noqa: F401
+from .task_listener import task_listener  # noqa: F401
@@ -0,0 +1,87 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Optional
+
+logger = logging.getLogger("cerrrbot")
+
+
+class LatencyStats:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, latency: float) -> None:
+        self.count += 1
+        self.total += latency
+        self.max = max(self.max, latency)
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "count": self.count,
+            "avg": self.total / self.count if self.count else 0,
+            "max": self.max,
+        }
+
+
+class ActionJobs:
+    # Actions of one message document are performed one by one, whether they're
+    # started by pressed button or by timer, so they don't race on message info.
+    def __init__(self):
+        self._locks: dict[str, asyncio.Lock] = {}
+        self._waiters: dict[str, int] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self.handler_latency = LatencyStats()
+        self.job_latency = LatencyStats()
+        self.failed = 0
+
+    @asynccontextmanager
+    async def lock(self, msgdoc_id: str) -> AsyncIterator[None]:
+        lock = self._locks.setdefault(msgdoc_id, asyncio.Lock())
+        self._waiters[msgdoc_id] = self._waiters.get(msgdoc_id, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._waiters[msgdoc_id] -= 1
+            if not self._waiters[msgdoc_id]:
+                del self._waiters[msgdoc_id]
+                del self._locks[msgdoc_id]
+
+    def submit(self, msgdoc_id: str, coro: Awaitable) -> asyncio.Task:
+        task = asyncio.create_task(self._run(msgdoc_id, coro), name=f"action_{msgdoc_id}")
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def stop(self, timeout: Optional[float] = None) -> None:
+        if self._tasks:
+            logger.info("Waiting for {} action jobs...".format(len(self._tasks)))
+            _, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+            for task in pending:
+                task.cancel()
+        logger.info("Action jobs stats: {}".format(self.stats()))
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "running": len(self._tasks),
+            "failed": self.failed,
+            "handler_latency": self.handler_latency.as_dict(),
+            "job_latency": self.job_latency.as_dict(),
+        }
+
+    async def _run(self, msgdoc_id: str, coro: Awaitable) -> Any:
+        started_at = time.monotonic()
+        try:
+            async with self.lock(msgdoc_id):
+                return await coro
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.job_latency.add(time.monotonic() - started_at)
+
+
+action_jobs = ActionJobs()
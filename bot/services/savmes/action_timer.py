@@ -0,0 +1,100 @@
+import asyncio
+import heapq
+import logging
+import time
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger("cerrrbot")
+
+
+class ActionTimer:
+    # deadlines are timestamps same as `cb_message_info.perform_action_at`,
+    # disarmed and rearmed entries are dropped from the heap lazily
+    def __init__(self):
+        self._deadlines: dict[str, int] = {}
+        self._heap: list[tuple[int, str]] = []
+        self._running: set[str] = set()
+        self._wakeup = asyncio.Event()
+        self._handler: Optional[Callable[[str], Awaitable]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._fired_tasks: set[asyncio.Task] = set()
+
+    def arm(self, msgdoc_id: str, deadline: int) -> None:
+        if deadline <= 0:
+            self.disarm(msgdoc_id)
+            return
+
+        if self._deadlines.get(msgdoc_id) == deadline:
+            return
+
+        self._deadlines[msgdoc_id] = deadline
+        heapq.heappush(self._heap, (deadline, msgdoc_id))
+        if self._heap[0] == (deadline, msgdoc_id):
+            self._wakeup.set()
+
+    def ensure_armed(self, msgdoc_id: str, deadline: int) -> bool:
+        if msgdoc_id in self._running or msgdoc_id in self._deadlines:
+            return False
+        self.arm(msgdoc_id, deadline)
+        return True
+
+    def disarm(self, msgdoc_id: str) -> None:
+        self._deadlines.pop(msgdoc_id, None)
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def start(self, handler: Callable[[str], Awaitable]) -> None:
+        self._handler = handler
+        self._task = asyncio.create_task(self._run())
+        logger.info("Action timer started with {} scheduled actions".format(len(self)))
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        if self._fired_tasks:
+            await asyncio.gather(*self._fired_tasks, return_exceptions=True)
+
+    async def _run(self) -> None:
+        while True:
+            self._drop_stale()
+            if self._heap:
+                timeout = self._heap[0][0] - time.time()
+                if timeout <= 0:
+                    self._fire(*heapq.heappop(self._heap))
+                    continue
+            else:
+                timeout = None
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _drop_stale(self) -> None:
+        while self._heap:
+            deadline, msgdoc_id = self._heap[0]
+            if self._deadlines.get(msgdoc_id) == deadline:
+                return
+            heapq.heappop(self._heap)
+
+    def _fire(self, deadline: int, msgdoc_id: str) -> None:
+        del self._deadlines[msgdoc_id]
+        logger.debug("[{}] Action deadline reached: {}".format(msgdoc_id, deadline))
+        task = asyncio.create_task(self._perform(msgdoc_id))
+        self._fired_tasks.add(task)
+        task.add_done_callback(self._fired_tasks.discard)
+
+    async def _perform(self, msgdoc_id: str) -> None:
+        self._running.add(msgdoc_id)
+        try:
+            await self._handler(msgdoc_id)
+        except Exception as exc:
+            logger.exception("[{}] Failed to perform scheduled action: {}".format(msgdoc_id, exc))
+        finally:
+            self._running.discard(msgdoc_id)
+
+
+action_timer = ActionTimer()
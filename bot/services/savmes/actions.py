@@ -6,6 +6,8 @@ from settings import DELETE_TIMEOUT_1, DELETE_TIMEOUT_2, DELETE_TIMEOUT_3, PLUGI
 
 from models import MessageAction
 
+from .pattern_guard import find_pathological, pattern_quarantine
+
 
 logger = logging.getLogger("cerrrbot")
 
@@ -84,6 +86,29 @@ class MESSAGE_ACTIONS:
             assert action.code not in self.BY_CODE, f"Duplicated actions can't be loaded: {action.code}"
             self.BY_CODE[action.code] = action
             self.CUSTOM_ACTION_BY_CODE[action.code] = action
+            self._vet_pattern(action)
+            if action.method_args.get("cache_ttl") and action.method_args.get("side_effects") is not False:
+                logger.warning(
+                    "[{}] cache_ttl is ignored, task doesn't declare side_effects: false".format(action.code)
+                )
+
+    @staticmethod
+    def _vet_pattern(action) -> None:
+        if not action.regex_pattern or action.regex_pattern == "*":
+            return
+
+        if action.pattern_error:
+            pattern_quarantine.add(action.code, action.pattern_error)
+            return
+
+        try:
+            reason = find_pathological(action.regex_pattern)
+        except Exception as exc:
+            # pattern compiles, so it's only guarded by matching timeout
+            logger.warning("[{}] Skip vetting of pattern: {}".format(action.code, exc))
+            return
+        if reason:
+            pattern_quarantine.add(action.code, reason)
 
 
 MessageActions = MESSAGE_ACTIONS()
@@ -16,26 +16,30 @@ from .message_document import MessageDocument
 logger = logging.getLogger("cerrrbot")
 
 
-def get_messages_to_perform_actions() -> List[MessageDocument]:
+async def get_messages_to_perform_actions() -> List[MessageDocument]:
     filter_search = {
         "cb_message_info.perform_action_at": {
             "$lt": int(datetime.now().timestamp()),
             "$gt": 0,
         }
     }
-    messages = NewMessagesCollection.get_documents_by_filter(filter_search)
+    messages = await NewMessagesCollection.get_documents_by_filter(filter_search)
     logger.debug("Found {} messages to perform action".format(len(messages)))
     return messages
 
 
-def get_deprecated_messages() -> List[MessageDocument]:
+async def get_deprecated_messages() -> List[MessageDocument]:
     filter_search = {
         "date": {
             "$lte": datetime.utcnow() - timedelta(seconds=MESSAGE_DOCUMENT_TTL),
         }
     }
-    messages = SavedMessagesCollection.get_documents_by_filter(filter_search)
-    messages.extend(NewMessagesCollection.get_documents_by_filter(filter_search))
+    messages = []
+    for collection in (SavedMessagesCollection, NewMessagesCollection):
+        messages.extend(
+            MessageDocument.from_document(document, collection)
+            for document in await collection.get_documents_by_filter(filter_search)
+        )
     logger.debug("Found {} deprecated messages".format(len(messages)))
     return messages
 
@@ -48,9 +52,15 @@ async def add_new_message(message: Message) -> AppResult:
 async def perform_message_action(
     message_id: str, bot: Bot, action_code: Optional[str] = None
 ) -> AppResult:
-    msgdoc = MessageDocument(message_id)
+    msgdoc = await MessageDocument.load(message_id)
+    return await perform_msgdoc_action(msgdoc, bot, action_code)
+
+
+async def perform_msgdoc_action(
+    msgdoc: MessageDocument, bot: Bot, action_code: Optional[str] = None
+) -> AppResult:
     if action_code:
-        msgdoc.update_message_info(MessageActions.BY_CODE[action_code])
+        await msgdoc.update_message_info(MessageActions.BY_CODE[action_code])
 
     action = msgdoc.cb_message_info.action
     cls_strategy = cls_strategy_by_content_type.get(msgdoc.content_type, ContentStrategy)
@@ -1,47 +1,52 @@
-import orjson as json
+import asyncio
 import logging
-from typing import Any, Dict, List, Optional
+import time
+from typing import Any, Dict
 
 from aiogram import Bot, F, Router
-from aiogram.filters.callback_data import CallbackData
-from aiogram.types import (
-    CallbackQuery,
-    InlineKeyboardButton,
-    InlineKeyboardMarkup,
-    Message,
-)
-from aiogram.utils.keyboard import InlineKeyboardBuilder
+from aiogram.types import CallbackQuery, Message
 
-from constants import CUSTOM_MESSAGE_MIN_ORDER
-from models import MessageAction
+from common import AppResult
+from models import NewMessagesCollection
+from settings import CALLBACK_ANSWER_WAIT
+from telegram_gateway import telegram_gateway
 from .actions import MessageActions
-from .api import add_new_message, get_messages_to_perform_actions, perform_message_action, get_deprecated_messages
+from .action_jobs import action_jobs
+from .action_timer import action_timer
+from .api import (
+    add_new_message,
+    get_deprecated_messages,
+    get_messages_to_perform_actions,
+    perform_message_action,
+    perform_msgdoc_action,
+)
 from .content_strategies import cls_strategy_by_content_type, ContentStrategy
+from .keyboard_edits import keyboard_edits
 from .message_document import MessageDocument
+from .task_listener import task_listener
+from .replies import SaveMessageData, build_message_actions_menu_kb, process_performed_action_result
+from .unit_of_work import UnitOfWorkMiddleware, unit_of_work
 
 logger = logging.getLogger("cerrrbot")
 
 
 router = Router()
-
-
-class SaveMessageData(CallbackData, prefix="SVM"):
-    action: str
-    msgdoc_id: str
+router.message.middleware(UnitOfWorkMiddleware())
+router.callback_query.middleware(UnitOfWorkMiddleware())
 
 
 @router.message()
-async def on_received_message(message: Message) -> None:
+async def on_received_message(message: Message, bot: Bot) -> None:
     logger.debug(f"Received new message: {message}")
     result = await add_new_message(message)
     if result:
-        await _process_received_message(message, result.data)
+        await _process_received_message(message, bot, result.data)
     else:
         logger.warning(f"Result adding: {result}")
 
 
 async def _process_received_message(
-    message: Message, result_data: Dict[str, Any]
+    message: Message, bot: Bot, result_data: Dict[str, Any]
 ) -> None:
     try:
         message_actions = result_data["reply_info"].actions
@@ -52,11 +57,13 @@ async def _process_received_message(
         return
 
     saved_message_id = result_data["_id"]
-    reply_action_message = await message.reply(
-        "Choose action for this message:",
-        reply_markup=_build_message_actions_menu_kb(message_actions, saved_message_id),
+    reply_markup = build_message_actions_menu_kb(message_actions, saved_message_id)
+    reply_action_message = await telegram_gateway.call(
+        bot, message.reply("Choose action for this message:", reply_markup=reply_markup)
     )
-    MessageDocument(saved_message_id).update_message_info(
+    keyboard_edits.remember(message.chat.id, reply_action_message.message_id, reply_markup)
+    msgdoc = await MessageDocument.load(saved_message_id)
+    await msgdoc.update_message_info(
         new_action=None, reply_action_message_id=reply_action_message.message_id
     )
 
@@ -66,87 +73,110 @@ async def on_action_pressed(
     query: CallbackQuery, callback_data: SaveMessageData, bot: Bot
 ) -> None:
     logger.info("Received data on chosen action: {}".format(callback_data))
+    started_at = time.monotonic()
     msgdoc_id = callback_data.msgdoc_id
-    result = await perform_message_action(msgdoc_id, bot, callback_data.action)
-    if not result:
-        await query.answer("Some error/exception occured, check logs for details.")
-        return
+    acknowledged = asyncio.Event()
+    job = action_jobs.submit(
+        msgdoc_id, _perform_pressed_action(query, callback_data, bot, acknowledged)
+    )
 
-    await process_performed_action_result(msgdoc_id, result, query=query)
+    # quick actions are answered with their result, slow ones are acknowledged at once
+    # and show their result by editing keyboard when they're done
+    done, _ = await asyncio.wait({job}, timeout=CALLBACK_ANSWER_WAIT)
+    if done:
+        result = job.result()
+        if result:
+            await process_performed_action_result(msgdoc_id, result, query=query, bot=bot)
+        else:
+            await telegram_gateway.call(
+                bot, query.answer("Some error/exception occured, check logs for details.")
+            )
+    else:
+        acknowledged.set()
+        await telegram_gateway.call(bot, query.answer())
+    action_jobs.handler_latency.add(time.monotonic() - started_at)
 
 
-async def perform_message_actions(bot: Bot) -> None:
-    messages = get_messages_to_perform_actions()
-    for msgdoc in messages:
-        msgdoc_id = str(msgdoc["_id"])
-        # MessageDocument(msgdoc_id).delete()
-        # continue
-        result = await perform_message_action(msgdoc_id, bot)
-        if result:
-            await process_performed_action_result(msgdoc_id, result, bot=bot, chat_id=msgdoc["chat"]["id"])
+async def _perform_pressed_action(
+    query: CallbackQuery, callback_data: SaveMessageData, bot: Bot, acknowledged: asyncio.Event
+) -> AppResult:
+    msgdoc_id = callback_data.msgdoc_id
+    try:
+        async with unit_of_work():
+            result = await perform_message_action(msgdoc_id, bot, callback_data.action)
+    except Exception as exc:
+        logger.exception(exc)
+        result = AppResult(False, exc)
 
+    if not acknowledged.is_set():
+        return result
 
-async def delete_deprecated_messages(bot: Bot) -> None:
-    messages = get_deprecated_messages()
-    for msg_data in messages:
-        msgdoc_id = str(msg_data["_id"])
-        msgdoc = MessageDocument(msgdoc_id)
-        logger.info(f"Removing deprecated message:{msgdoc}")
-        _cls = cls_strategy_by_content_type.get(msgdoc.content_type, ContentStrategy)
-        await _cls.delete_reply_message(msgdoc, bot)
-        msgdoc.delete()
-
-
-async def process_performed_action_result(
-    msgdoc_id: str, result: Dict[str, Any],
-    query: Optional[CallbackQuery] = None,
-    bot: Optional[Bot] = None, chat_id: Optional[int] = None
-) -> None:
+    if result:
+        await process_performed_action_result(
+            msgdoc_id, result, bot=bot,
+            chat_id=query.message.chat.id, message_id=query.message.message_id,
+        )
+    else:
+        logger.error("[{}] Failed to perform action {}: {}".format(msgdoc_id, callback_data.action, result))
+        # query is already answered, so failure is reported with reply to actions message
+        try:
+            await telegram_gateway.call(
+                bot, query.message.reply("Some error/exception occured, check logs for details.")
+            )
+        except Exception as exc:
+            logger.error("[{}] Failed to report failed action: {}".format(msgdoc_id, exc))
+    return result
+
+
+async def start_action_timer(bot: Bot) -> None:
+    for msgdoc_id, perform_action_at in await NewMessagesCollection.get_scheduled_actions():
+        action_timer.arm(msgdoc_id, perform_action_at)
+    action_timer.start(lambda msgdoc_id: perform_scheduled_action(msgdoc_id, bot))
+
+
+def start_task_listener(bot: Bot) -> None:
+    task_listener.start(
+        lambda task_id, msgdoc_id, status: ContentStrategy.on_task_finished(
+            task_id, msgdoc_id, status, bot
+        )
+    )
 
-    try:
-        reply_info = result.data["reply_info"]
-    except (AttributeError, KeyError):
-        reply_info = None
-        pass
 
-    if not (reply_info and reply_info.actions):
-        return
+async def perform_scheduled_action(msgdoc_id: str, bot: Bot) -> None:
+    async with action_jobs.lock(msgdoc_id), unit_of_work():
+        await _perform_scheduled_action(msgdoc_id, bot)
 
-    next_markup = _build_message_actions_menu_kb(reply_info.actions, msgdoc_id)
 
-    if query:
-        if reply_info.popup_text:
-            await query.answer(reply_info.popup_text)
-        if reply_info.need_edit_buttons:
-            await query.message.edit_reply_markup(next_markup)
+async def _perform_scheduled_action(msgdoc_id: str, bot: Bot) -> None:
+    try:
+        msgdoc = await MessageDocument.load(msgdoc_id)
+    except Exception as exc:
+        logger.warning("[{}] Skip scheduled action: {}".format(msgdoc_id, exc))
         return
 
-    if not reply_info.reply_action_message_id or not reply_info.need_edit_buttons:
+    if not msgdoc.is_action_due():
         return
-    await bot.edit_message_reply_markup(chat_id, reply_info.reply_action_message_id, reply_markup=next_markup)
-
-
-def _build_message_actions_menu_kb(
-    reply_actions: List[MessageAction], msgdoc_id: str
-) -> InlineKeyboardMarkup:
-
-    kb_builder = InlineKeyboardBuilder()
-    actions_buttons = []
-    custom_actions_buttons = {}
-    for action in reply_actions:
-        button = InlineKeyboardButton(
-            text=action.caption,
-            callback_data=SaveMessageData(
-                action=action.code,
-                msgdoc_id=msgdoc_id,
-            ).pack(),
-        )
-        if action.order >= CUSTOM_MESSAGE_MIN_ORDER:
-            custom_actions_buttons.setdefault(action.order // 100, []).append(button)
-        else:
-            actions_buttons.append(button)
-    kb_builder.row(*actions_buttons)
-    for buttons in custom_actions_buttons.values():
-        kb_builder.row(*buttons)
 
-    return kb_builder.as_markup()
+    result = await perform_msgdoc_action(msgdoc, bot)
+    if result:
+        await process_performed_action_result(msgdoc_id, result, bot=bot, chat_id=msgdoc.chat.id)
+
+
+async def perform_message_actions(bot: Bot) -> None:
+    # safety net for actions missed by timer, e.g. updated by another process
+    messages = await get_messages_to_perform_actions()
+    for msgdoc in messages:
+        msgdoc_id = str(msgdoc["_id"])
+        if action_timer.ensure_armed(msgdoc_id, msgdoc["cb_message_info"]["perform_action_at"]):
+            logger.info("[{}] Rearmed missed action".format(msgdoc_id))
+
+
+async def delete_deprecated_messages(bot: Bot) -> None:
+    async with unit_of_work():
+        msgdocs = await get_deprecated_messages()
+        for msgdoc in msgdocs:
+            logger.info(f"Removing deprecated message:{msgdoc}")
+            _cls = cls_strategy_by_content_type.get(msgdoc.content_type, ContentStrategy)
+            await _cls.delete_reply_message(msgdoc, bot)
+        if msgdocs:
+            await MessageDocument.delete_many(msgdocs)
@@ -3,22 +3,34 @@ import os
 from typing import Any, Optional, Union
 
 from aiogram import Bot
+from aiogram.methods import DeleteMessage, GetStickerSet
 from aiogram.types import ContentType
-from celery import signature, states
-from celery.result import AsyncResult as CeleryTaskResult
+from celery import states
 
-from common import AppResult, save_file
-from models import CustomMessageAction
+from common import AppResult, DownloadFile, download_engine, run_in_background
+from models import CustomMessageAction, MessageAction
 from celery_app import app
+from settings import CELERY_PAYLOAD_BY_REFERENCE
+from task_executor import task_executor
+from task_payloads import make_reference
+from telegram_gateway import telegram_gateway
 
 from .actions import MessageActions
+from .action_jobs import action_jobs
 from .message_document_info import SVM_MsgdocInfo, SVM_ReplyInfo
 from .constants import COMMON_GROUP_KEY, MAX_LOAD_FILE_SIZE
 from .content_strategy_base import ContentStrategyBase
+from .keyboard_edits import keyboard_edits
 from .message_document import MessageDocument
+from .replies import process_performed_action_result
+from .task_listener import task_listener
+from .task_results import task_result_cache
+from .unit_of_work import run_after_flush, unit_of_work
 
 logger = logging.getLogger("cerrrbot")
 
+_downloads_in_progress: set[str] = set()
+
 
 class ContentStrategy(ContentStrategyBase):
     @classmethod
@@ -50,58 +62,130 @@ class ContentStrategy(ContentStrategyBase):
         action_data = msgdoc.cb_message_info.actions[action_code]
         task_id = action_data.get("task_id")
         if task_id:
-            result = cls._get_task_reply(task_id, action, msgdoc)
+            result = await cls._get_task_reply(task_id, action, msgdoc)
         else:
-            result = cls._create_task(task_info, action_data["data"], action, msgdoc)
+            result = await cls._create_task(task_info, action_data["data"], action, msgdoc)
         return result
 
     @classmethod
-    def _create_task(
+    async def _create_task(
         cls,
         task_info: dict[str, Any],
         task_args: dict[str, Any],
         action: CustomMessageAction,
         msgdoc: MessageDocument,
     ) -> AppResult:
-        task_signature = signature(task_info["task_name"])
         if task_info.get("is_instant", False):
-            task_signature(task_args, msgdoc)
-            return cls._update_actions(msgdoc, (action,))
+            result = await task_executor.run(
+                task_info["task_name"], task_args, msgdoc, timeout=task_info.get("timeout")
+            )
+            if not result:
+                return result
+            return await cls._update_actions(msgdoc, (action,))
+
+        if task_result_cache.is_enabled(action):
+            cached = await task_result_cache.get(action, task_args)
+            if cached is not None:
+                result = await cls._update_actions(msgdoc, (action,))
+                result.data["reply_info"] = SVM_ReplyInfo(
+                    actions=msgdoc.cb_message_info.actions, popup_text=f"{states.SUCCESS} (cached)"
+                )
+                return result
+
+        task_signature = app.signature(task_info["task_name"])
+
+        if task_info.get("payload_by_reference", CELERY_PAYLOAD_BY_REFERENCE):
+            msgdoc_payload = make_reference(msgdoc._id, msgdoc.collection.name)
+        else:
+            msgdoc_payload = msgdoc.json_dict()
 
         try:
-            result = task_signature.delay(task_args, msgdoc.json_dict())
-            task_id = str(result)
-            task_status = CeleryTaskResult(task_id, app=app).status
+            task_id = str(task_signature.delay(task_args, msgdoc_payload))
         except Exception as exc:
             logger.exception(exc)
             return AppResult(False)
 
+        # just sent task can't be in other state, listener will update it when finished
         result_data = {
             "task_id": task_id,
-            "additional_caption": f" [{task_status}]",
+            "additional_caption": f" [{states.PENDING}]",
         }
 
-        return cls._update_actions(msgdoc, to_add={action: result_data})
+        result = await cls._update_actions(msgdoc, to_add={action: result_data})
+        if result:
+            # finished task is looked up by its task_id in stored message info,
+            # listener checks status on watch, so tasks finished earlier aren't missed
+            msgdoc_id = msgdoc._id
+            run_after_flush(lambda: task_listener.watch(task_id, msgdoc_id))
+        return result
 
     @classmethod
-    def _get_task_reply(
+    async def _get_task_reply(
         cls, task_id: str, action: CustomMessageAction, msgdoc: MessageDocument
     ) -> AppResult:
-        task_result = CeleryTaskResult(task_id, app=app)
-        status = task_result.status
+        status = (await task_listener.get_statuses((task_id,)))[task_id]
         reply_info = SVM_ReplyInfo(popup_text=status)
-        if status == states.SUCCESS:
-            result = cls._update_actions(msgdoc, (action,))
+        if status in states.READY_STATES:
+            task_listener.forget(task_id)
+            result = await cls._apply_task_status(msgdoc, action, status)
             reply_info.actions = msgdoc.cb_message_info.actions
         else:
+            # e.g. task was sent before bot restart
+            task_listener.watch(task_id, msgdoc._id)
             result = AppResult()
             reply_info.need_edit_buttons = False
         result.data["reply_info"] = reply_info
         return result
 
+    @classmethod
+    async def on_task_finished(cls, task_id: str, msgdoc_id: str, status: str, bot: Bot) -> None:
+        async with action_jobs.lock(msgdoc_id), unit_of_work():
+            try:
+                msgdoc = await MessageDocument.load(msgdoc_id)
+            except Exception as exc:
+                logger.warning("[{}] Message is gone before task finished: {}".format(msgdoc_id, exc))
+                return
+
+            action = next(
+                (
+                    MessageActions.BY_CODE[action_code]
+                    for action_code, action_data in msgdoc.cb_message_info.actions.items()
+                    if action_data.get("task_id") == task_id
+                ),
+                None,
+            )
+            if action is None:
+                return
+
+            result = await cls._apply_task_status(msgdoc, action, status)
+            if not result:
+                return
+
+            result.data["reply_info"] = SVM_ReplyInfo(
+                actions=msgdoc.cb_message_info.actions,
+                reply_action_message_id=msgdoc.cb_message_info.reply_action_message_id,
+            )
+            cls._prepare_reply_info(msgdoc.cb_message_info, result.data)
+            await process_performed_action_result(msgdoc_id, result, bot=bot, chat_id=msgdoc.chat.id)
+
+    @classmethod
+    async def _apply_task_status(
+        cls, msgdoc: MessageDocument, action: CustomMessageAction, status: str
+    ) -> AppResult:
+        action_data = msgdoc.cb_message_info.actions[action.code]
+        if status == states.SUCCESS:
+            if task_result_cache.is_enabled(action):
+                task_result = await task_listener.get_result(action_data["task_id"])
+                await task_result_cache.put(action, action_data["data"], task_result)
+            return await cls._update_actions(msgdoc, (action,))
+
+        return await cls._update_actions(
+            msgdoc, to_add={action: {**action_data, "additional_caption": f" [{status}]"}}
+        )
+
     @classmethod
     async def keep(cls, msgdoc: MessageDocument, bot: Bot) -> AppResult:
-        del_result = msgdoc.delete()
+        del_result = await msgdoc.delete()
         if not del_result:
             return del_result
 
@@ -109,12 +193,12 @@ class ContentStrategy(ContentStrategyBase):
         if not result:
             return result
 
-        result.merge(msgdoc.add_to_collection())
+        result.merge(await msgdoc.add_to_collection())
         return result
 
     @classmethod
     async def delete_request(cls, msgdoc: MessageDocument, *args, **kwargs) -> AppResult:
-        result = msgdoc.update_message_info(MessageActions.NONE)
+        result = await msgdoc.update_message_info(MessageActions.NONE)
         reply_info = SVM_ReplyInfo(
             actions={
                 MessageActions.DELETE_1,
@@ -127,7 +211,7 @@ class ContentStrategy(ContentStrategyBase):
 
     @classmethod
     async def delete(cls, msgdoc: MessageDocument, bot: Bot) -> AppResult:
-        result = msgdoc.delete()
+        result = await msgdoc.delete()
         if result:
             result = await cls.delete_from_chat(msgdoc, bot)
         return result
@@ -136,7 +220,9 @@ class ContentStrategy(ContentStrategyBase):
     async def delete_from_chat(cls, msgdoc: MessageDocument, bot: Bot) -> AppResult:
         result = await cls.delete_reply_message(msgdoc, bot)
         try:
-            result_ = await bot.delete_message(msgdoc.chat.id, msgdoc.message_id)
+            await telegram_gateway.call(
+                bot, DeleteMessage(chat_id=msgdoc.chat.id, message_id=msgdoc.message_id)
+            )
             result_ = AppResult()
         except Exception as exc:
             logger.error(exc)
@@ -153,7 +239,10 @@ class ContentStrategy(ContentStrategyBase):
             return AppResult()
 
         try:
-            result = await bot.delete_message(msgdoc.chat.id, message_id)
+            await keyboard_edits.forget(msgdoc.chat.id, message_id)
+            result = await telegram_gateway.call(
+                bot, DeleteMessage(chat_id=msgdoc.chat.id, message_id=message_id)
+            )
             result = AppResult(result)
         except AttributeError:
             logger.warning(
@@ -165,7 +254,7 @@ class ContentStrategy(ContentStrategyBase):
             return AppResult(False, str(exc))
 
         if msgdoc.collection:
-            result_ = msgdoc.update_message_info(None, new_actions={}, reply_action_message_id=0)
+            result_ = await msgdoc.update_message_info(None, new_actions={}, reply_action_message_id=0)
             result.merge(result_)
 
         result.data.update({"reply_info": SVM_ReplyInfo(actions={})})
@@ -175,7 +264,7 @@ class ContentStrategy(ContentStrategyBase):
     async def _delete_after_time(
         cls, msgdoc: MessageDocument, bot: Bot, timeout: int
     ) -> AppResult:
-        result = msgdoc.update_message_info(MessageActions.DELETE_NOW, new_ttl=timeout)
+        result = await msgdoc.update_message_info(MessageActions.DELETE_NOW, new_ttl=timeout)
         result.data.update({"reply_info": SVM_ReplyInfo(need_edit_buttons=False)})
         return result
 
@@ -197,8 +286,8 @@ class _DownloadableContentStrategy(ContentStrategy):
     POSSIBLE_ACTIONS = {MessageActions.KEEP, MessageActions.DELETE_REQUEST, MessageActions.DOWNLOAD}
 
     @classmethod
-    def _prepare_message_info(cls, message_data: dict[str, Any]) -> SVM_MsgdocInfo:
-        message_info = super()._prepare_message_info(message_data)
+    async def _prepare_message_info(cls, message_data: dict[str, Any]) -> SVM_MsgdocInfo:
+        message_info = await super()._prepare_message_info(message_data)
         message_actions = message_info.actions
         fsize = 0 if cls.content_type_key == ContentType.PHOTO else message_data[cls.content_type_key]["file_size"]
         if fsize < MAX_LOAD_FILE_SIZE:
@@ -208,63 +297,145 @@ class _DownloadableContentStrategy(ContentStrategy):
                 message_actions[MessageActions.DOWNLOAD_ALL.code] = {}
         return message_info
 
+    @classmethod
+    async def keep(cls, msgdoc: MessageDocument, bot: Bot) -> AppResult:
+        msgdocs = await msgdoc.get_msgdocs_by_group()
+        if not msgdocs:
+            return await super().keep(msgdoc, bot)
+
+        result = await MessageDocument.delete_many(msgdocs)
+        if not result:
+            return result
+
+        for msgdoc_ in msgdocs:
+            result.merge(await cls.delete_reply_message(msgdoc_, bot))
+        if not result:
+            return result
+
+        result.merge(await MessageDocument.add_many_to_collection(msgdocs))
+        return result
+
     @classmethod
     async def delete(cls, msgdoc: MessageDocument, bot: Bot) -> AppResult:
-        msgdocs = msgdoc.get_msgdocs_by_group()
+        msgdocs = await msgdoc.get_msgdocs_by_group()
         if not msgdocs:
             result = await super().delete(msgdoc, bot)
             return result
 
-        result = AppResult()
+        result = await MessageDocument.delete_many(msgdocs)
+        if not result:
+            return result
+
         for msgdoc_ in msgdocs:
-            result_ = await super().delete(msgdoc_, bot)
+            result_ = await cls.delete_from_chat(msgdoc_, bot)
             result.merge(result_)
         return result
 
     @classmethod
     async def download(cls, msgdoc: MessageDocument, bot: Bot) -> AppResult:
-        result = AppResult()
-        msgdocs = msgdoc.get_msgdocs_by_group()
-        if msgdocs:
-            for _msgdoc in msgdocs:
-               _cls = cls_strategy_by_content_type[_msgdoc.content_type]
-               _result = await _cls._download(_msgdoc, bot)
-               result.merge(_result)
+        files = []
+        for _msgdoc in await msgdoc.get_msgdocs_by_group() or (msgdoc,):
+            _cls = cls_strategy_by_content_type[_msgdoc.content_type]
+            file = _cls._get_download_file(_msgdoc)
+            if not file:
+                return AppResult(False, "Nothing to download in message: {}".format(_msgdoc._id))
+            files.append(file)
+
+        return await cls._start_download(
+            msgdoc, bot, files, (MessageActions.DOWNLOAD, MessageActions.DOWNLOAD_ALL)
+        )
+
+    @classmethod
+    async def _start_download(
+        cls,
+        msgdoc: MessageDocument,
+        bot: Bot,
+        files: list[DownloadFile],
+        done_actions: tuple[MessageAction, ...],
+    ) -> AppResult:
+        if msgdoc._id in _downloads_in_progress:
+            popup_text = "Download is already in progress"
+            result = AppResult()
         else:
-            result = await cls._download(msgdoc, bot)
+            _downloads_in_progress.add(msgdoc._id)
+            # pending default action must not start the same download again
+            result = await msgdoc.update_message_info(MessageActions.NONE)
+            run_in_background(
+                cls._download_in_background(msgdoc._id, msgdoc.chat.id, bot, files, done_actions),
+                name=f"download:{msgdoc._id}",
+            )
+            popup_text = "Downloading {} file(s)...".format(len(files))
 
-        if result:
-            result = cls._update_actions(msgdoc, (MessageActions.DOWNLOAD, MessageActions.DOWNLOAD_ALL))
+        result.data["reply_info"] = SVM_ReplyInfo(
+            actions=msgdoc.cb_message_info.actions,
+            popup_text=popup_text,
+            need_edit_buttons=False,
+        )
         return result
 
     @classmethod
-    async def _download(cls, msgdoc: MessageDocument, bot: Bot) -> AppResult:
+    async def _download_in_background(
+        cls,
+        msgdoc_id: str,
+        chat_id: int,
+        bot: Bot,
+        files: list[DownloadFile],
+        done_actions: tuple[MessageAction, ...],
+    ) -> None:
+        try:
+            download_result = await download_engine.download_all(bot, files, chat_id)
+        finally:
+            _downloads_in_progress.discard(msgdoc_id)
+
+        logger.info("[{}] {}".format(msgdoc_id, download_result.info))
+        if not download_result:
+            return
+
+        async with action_jobs.lock(msgdoc_id), unit_of_work():
+            try:
+                msgdoc = await MessageDocument.load(msgdoc_id)
+            except Exception as exc:
+                logger.warning("[{}] Message is gone after download: {}".format(msgdoc_id, exc))
+                return
+
+            result = await cls._update_actions(msgdoc, done_actions)
+            if not result:
+                return
+
+            result.data["reply_info"] = SVM_ReplyInfo(
+                actions=msgdoc.cb_message_info.actions,
+                reply_action_message_id=msgdoc.cb_message_info.reply_action_message_id,
+            )
+            cls._prepare_reply_info(msgdoc.cb_message_info, result.data)
+            await process_performed_action_result(msgdoc_id, result, bot=bot, chat_id=chat_id)
+
+    @classmethod
+    def _get_download_file(cls, msgdoc: MessageDocument) -> Optional[DownloadFile]:
         from_user, _ = msgdoc.get_from_user_data()
         from_chat, _ = msgdoc.get_from_chat_data()
-        return await cls._download_file_impl(
+        return cls._get_download_file_impl(
             getattr(msgdoc, cls.content_type_key),
-            bot,
             from_user=from_user,
             from_chat=from_chat,
         )
 
     @classmethod
-    async def _download_file_impl(
+    def _get_download_file_impl(
         cls,
         downloadable: list[Any],
-        bot: Bot,
         from_user: Optional[str] = "",
         from_chat: Optional[str] = "",
         dir_name: Optional[str] = "",
-    ) -> AppResult:
+    ) -> Optional[DownloadFile]:
 
         file_data = cls._best_quality_variant(downloadable)
         if not file_data:
-            return AppResult(False, "Wrong downloadable_data: {}".format(downloadable))
+            logger.error("Wrong downloadable_data: {}".format(downloadable))
+            return None
 
         dir_path = os.path.join(str(from_user), dir_name)
         file_name = cls._get_file_name(file_data, from_user, from_chat)
-        return await save_file(bot, file_data.file_id, file_name, dir_path)
+        return DownloadFile(file_data.file_id, file_name, dir_path, file_data.file_unique_id)
 
     @classmethod
     def _best_quality_variant(
@@ -339,16 +510,15 @@ class StickerContentStrategy(_DownloadableContentStrategy):
 
     @classmethod
     async def download_all(cls, msgdoc: MessageDocument, bot: Bot) -> AppResult:
-        result = AppResult()
         sticker_set_name = msgdoc.sticker.set_name
-        sticker_set = await bot.get_sticker_set(sticker_set_name)
-        for sticker in sticker_set.stickers:
-            result_ = await cls._download_file_impl(sticker, bot, dir_name=sticker_set_name)
-            result.merge(result_)
-
-        if result:
-            result = cls._update_actions(msgdoc, (MessageActions.DOWNLOAD_ALL,))
-        return result
+        sticker_set = await telegram_gateway.call(bot, GetStickerSet(name=sticker_set_name))
+        files = [
+            cls._get_download_file_impl(sticker, dir_name=sticker_set_name)
+            for sticker in sticker_set.stickers
+        ]
+        return await cls._start_download(
+            msgdoc, bot, [file for file in files if file], (MessageActions.DOWNLOAD_ALL,)
+        )
 
     @classmethod
     def _get_extension(cls, file_data: Any) -> str:
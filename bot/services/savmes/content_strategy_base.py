@@ -1,4 +1,5 @@
 import logging
+from dataclasses import asdict
 from typing import Any, Dict, List, Optional
 
 from aiogram.types import Message
@@ -30,12 +31,13 @@ class ContentStrategyBase:
     async def add_new_message(cls, message: Message) -> AppResult:
         message_data = message.dict(exclude_none=True, exclude_defaults=True)
         logger.info("Adding message: {}".format(message_data))
-        add_result = NewMessagesCollection.add_document(message_data)
+        add_result = await NewMessagesCollection.add_document(message_data)
         if add_result:
             added_message_id = add_result.data["_id"]
             logger.info("Saved new message with _id:[{}]".format(str(added_message_id)))
-            message_info = cls._prepare_message_info(message_data)
-            MessageDocument(added_message_id).update_message_info(
+            message_info = await cls._prepare_message_info(message_data)
+            msgdoc = MessageDocument.from_document(message_data, NewMessagesCollection)
+            await msgdoc.update_message_info(
                 message_info.action,
                 message_info.actions,
                 cls.DEFAULT_MESSAGE_TTL,
@@ -49,10 +51,10 @@ class ContentStrategyBase:
         return add_result
 
     @classmethod
-    def _prepare_message_info(cls, message_data: Dict[str, Any]) -> SVM_MsgdocInfo:
+    async def _prepare_message_info(cls, message_data: Dict[str, Any]) -> SVM_MsgdocInfo:
         message_info = SVM_MsgdocInfo(action=cls.DEFAULT_ACTION)
         common_group_id = message_data.get(COMMON_GROUP_KEY)
-        if not common_group_id or not NewMessagesCollection.exists_document_in_group(
+        if not common_group_id or not await NewMessagesCollection.exists_document_in_group(
             COMMON_GROUP_KEY, common_group_id
         ):
             message_info.actions = {action.code: {} for action in cls.POSSIBLE_ACTIONS}
@@ -66,7 +68,7 @@ class ContentStrategyBase:
         try:
             reply_info = result_data["reply_info"]
         except KeyError:
-            reply_info = SVM_ReplyInfo(**vars(message_info))
+            reply_info = SVM_ReplyInfo(**asdict(message_info))
 
         if not reply_info.actions:
             return
@@ -94,7 +96,7 @@ class ContentStrategyBase:
         message_info.actions.update(parser.actions)
 
     @classmethod
-    def _update_actions(
+    async def _update_actions(
         cls,
         msgdoc: MessageDocument,
         to_delete: Optional[List[MessageAction]] = None,
@@ -108,5 +110,5 @@ class ContentStrategyBase:
         if to_add:
             for action, data in to_add.items():
                 message_actions[action.code] = data or {}
-        result = msgdoc.update_message_info(new_actions=message_actions)
+        result = await msgdoc.update_message_info(new_actions=message_actions)
         return result
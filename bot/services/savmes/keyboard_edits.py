@@ -0,0 +1,134 @@
+import asyncio
+import logging
+from typing import Any, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.methods import EditMessageReplyMarkup
+from aiogram.types import InlineKeyboardMarkup
+
+from common import LRUCache
+from settings import KEYBOARD_EDIT_CACHE_SIZE, KEYBOARD_EDIT_WINDOW
+from telegram_gateway import telegram_gateway
+
+logger = logging.getLogger("cerrrbot")
+
+
+def get_markup_hash(markup: Optional[InlineKeyboardMarkup]) -> int:
+    return hash(markup.json(exclude_none=True) if markup else None)
+
+
+class KeyboardEditBuffer:
+    # Edits of reply message's keyboard scheduled within window are merged, so only
+    # the last markup is sent; edit is skipped if it's same as already shown one.
+    # Edits of one message are sent one by one by the same task.
+    def __init__(self, window: float, cache_size: int):
+        self.window = window
+        self._pending: dict[tuple[int, int], tuple[Bot, InlineKeyboardMarkup]] = {}
+        self._tasks: dict[tuple[int, int], asyncio.Task] = {}
+        self._sending: set[tuple[int, int]] = set()
+        self._sent_hashes = LRUCache(cache_size)
+        self._stopped = False
+        self._stats = {
+            "scheduled": 0,
+            "sent": 0,
+            "merged": 0,
+            "skipped": 0,
+            "failed": 0,
+            "dropped": 0,
+        }
+
+    def remember(self, chat_id: int, message_id: int, markup: Optional[InlineKeyboardMarkup]) -> None:
+        self._sent_hashes.put((chat_id, message_id), get_markup_hash(markup))
+
+    async def forget(self, chat_id: int, message_id: int) -> None:
+        key = (chat_id, message_id)
+        self._pending.pop(key, None)
+        task = self._tasks.get(key)
+        if task and key in self._sending:
+            # request can't be taken back once sent, so wait until it's done
+            await asyncio.shield(task)
+        elif task:
+            del self._tasks[key]
+            task.cancel()
+        self._sent_hashes.pop(key)
+
+    def schedule(
+        self, bot: Bot, chat_id: int, message_id: int, markup: InlineKeyboardMarkup
+    ) -> None:
+        if self._stopped:
+            self._stats["dropped"] += 1
+            logger.warning("[{}] Keyboard edit is dropped on shutdown".format(message_id))
+            return
+
+        key = (chat_id, message_id)
+        self._stats["scheduled"] += 1
+        if key in self._pending:
+            self._stats["merged"] += 1
+        self._pending[key] = (bot, markup)
+        if key not in self._tasks:
+            # task copies caller's context, so edit keeps priority of update which caused it
+            self._tasks[key] = asyncio.create_task(self._flush_later(key))
+
+    async def stop(self) -> None:
+        self._stopped = True
+        tasks = list(self._tasks.items())
+        for key, task in tasks:
+            # ones being sent finish with edits scheduled meanwhile
+            if key not in self._sending:
+                task.cancel()
+        await asyncio.gather(*(task for _, task in tasks), return_exceptions=True)
+        for key in list(self._pending):
+            await self._flush(key)
+        logger.info("Keyboard edits stats: {}".format(self.stats()))
+
+    def stats(self) -> dict[str, Any]:
+        return dict(self._stats, pending=len(self._pending), cached=len(self._sent_hashes))
+
+    async def _flush_later(self, key: tuple[int, int]) -> None:
+        try:
+            await asyncio.sleep(self.window)
+            # edits scheduled while previous one was sent are sent right after it
+            while key in self._pending:
+                await self._flush(key)
+        finally:
+            if self._tasks.get(key) is asyncio.current_task():
+                del self._tasks[key]
+
+    async def _flush(self, key: tuple[int, int]) -> None:
+        try:
+            bot, markup = self._pending.pop(key)
+        except KeyError:
+            return
+
+        markup_hash = get_markup_hash(markup)
+        if self._sent_hashes.get(key) == markup_hash:
+            self._stats["skipped"] += 1
+            return
+
+        chat_id, message_id = key
+        self._sending.add(key)
+        try:
+            await telegram_gateway.call(
+                bot,
+                EditMessageReplyMarkup(chat_id=chat_id, message_id=message_id, reply_markup=markup),
+            )
+        except TelegramBadRequest as exc:
+            if "message is not modified" not in str(exc):
+                self._stats["failed"] += 1
+                logger.error("[{}] Failed to edit keyboard: {}".format(message_id, exc))
+                return
+            self._stats["skipped"] += 1
+        except Exception as exc:
+            self._stats["failed"] += 1
+            logger.error("[{}] Failed to edit keyboard: {}".format(message_id, exc))
+            return
+        else:
+            self._stats["sent"] += 1
+        finally:
+            self._sending.discard(key)
+
+        self._sent_hashes.put(key, markup_hash)
+
+
+keyboard_edits = KeyboardEditBuffer(KEYBOARD_EDIT_WINDOW, KEYBOARD_EDIT_CACHE_SIZE)
@@ -11,9 +11,11 @@ from aiogram.types import Message
 from common import AppResult
 from models import MessageAction, MessagesBaseCollection, NewMessagesCollection, SavedMessagesCollection
 
+from .action_timer import action_timer
 from .actions import MessageActions
 from .message_document_info import SVM_MsgdocInfo
 from .constants import COMMON_GROUP_KEY
+from .unit_of_work import document_cache, get_unit_of_work
 
 logger = logging.getLogger("cerrrbot")
 
@@ -21,12 +23,46 @@ logger = logging.getLogger("cerrrbot")
 class MessageDocument(Message):
     _id: str
 
-    def __init__(self, document_id: str):
+    def __init__(self, document_data: dict[str, Any]):
         self.__config__.allow_mutation = True
-        document_data = self._fetch_document_data(document_id)
         super().__init__(**document_data)
         self._load()
 
+    @classmethod
+    async def load(cls, document_id: str) -> MessageDocument:
+        uow = get_unit_of_work()
+        if uow is not None and document_id in uow.identity_map:
+            return uow.identity_map[document_id]
+
+        document_data = document_cache.get(document_id)
+        if document_data is None:
+            document_data = await cls._fetch_document_data(document_id)
+            document_cache.put(document_id, document_data)
+
+        msgdoc = cls(document_data)
+        msgdoc._register()
+        return msgdoc
+
+    @classmethod
+    def from_document(
+        cls, document_data: dict[str, Any], collection: MessagesBaseCollection
+    ) -> MessageDocument:
+        document_id = str(document_data["_id"])
+        uow = get_unit_of_work()
+        if uow is not None and document_id in uow.identity_map:
+            return uow.identity_map[document_id]
+
+        document_data = {**document_data, "_id": document_id, "collection": collection}
+        document_cache.put(document_id, document_data)
+        msgdoc = cls(document_data)
+        msgdoc._register()
+        return msgdoc
+
+    def _register(self) -> None:
+        uow = get_unit_of_work()
+        if uow is not None:
+            uow.identity_map[self._id] = self
+
     def _load(self) -> None:
         try:
             cb_message_info = self.cb_message_info
@@ -34,8 +70,9 @@ class MessageDocument(Message):
             logger.debug(f"Empty message info: {exc}")
             cb_message_info = {}
         self.cb_message_info = from_dict(data_class=SVM_MsgdocInfo, data=cb_message_info)
+        self.cb_message_info.mark_clean()
 
-    def add_to_collection(
+    async def add_to_collection(
         self, collection: Optional[MessagesBaseCollection] = SavedMessagesCollection
     ) -> AppResult:
         if self.collection == collection:
@@ -47,12 +84,31 @@ class MessageDocument(Message):
             )
 
         dict_obj = self.json_dict()
-        add_result = collection.add_document(dict_obj)
+        add_result = await collection.add_document(dict_obj)
         if add_result:
-            self.collection = collection
+            self._on_added(collection)
         return add_result
 
-    def get_msgdocs_by_group(self) -> Optional[Sequence[MessageDocument]]:
+    @classmethod
+    async def add_many_to_collection(
+        cls,
+        msgdocs: Sequence[MessageDocument],
+        collection: Optional[MessagesBaseCollection] = SavedMessagesCollection,
+    ) -> AppResult:
+        msgdocs = [msgdoc for msgdoc in msgdocs if msgdoc.collection != collection]
+        add_result = await collection.add_documents([msgdoc.json_dict() for msgdoc in msgdocs])
+        if add_result:
+            for msgdoc in msgdocs:
+                msgdoc._on_added(collection)
+        return add_result
+
+    def _on_added(self, collection: MessagesBaseCollection) -> None:
+        self.collection = collection
+        self.cb_message_info.mark_clean()
+        document_cache.move(self._id, collection)
+        self._register()
+
+    async def get_msgdocs_by_group(self) -> Optional[Sequence[MessageDocument]]:
         try:
             group_key_value = getattr(self, COMMON_GROUP_KEY)
             if group_key_value is None:
@@ -61,18 +117,42 @@ class MessageDocument(Message):
         except (AttributeError, TypeError):
             return None
 
-        return (
-            MessageDocument(md["_id"])
-            for md in NewMessagesCollection.get_documents_by_filter(filter_search)
-        )
+        return [
+            MessageDocument.from_document(md, NewMessagesCollection)
+            for md in await NewMessagesCollection.get_documents_by_filter(filter_search)
+        ]
 
-    def delete(self) -> AppResult:
+    async def delete(self) -> AppResult:
         logger.info(f"delete document: id:{self._id}, collection: {self.collection}")
-        delete_result = self.collection.del_document(self._id)
+        delete_result = await self.collection.del_document(self._id)
         if delete_result:
-            self.collection = None
+            self._on_deleted()
         return delete_result
 
+    @classmethod
+    async def delete_many(cls, msgdocs: Sequence[MessageDocument]) -> AppResult:
+        result = AppResult()
+        for collection, collection_msgdocs in _group_by_collection(msgdocs).items():
+            logger.info(
+                "delete documents: ids:{}, collection: {}".format(
+                    [msgdoc._id for msgdoc in collection_msgdocs], collection
+                )
+            )
+            delete_result = await collection.del_documents([msgdoc._id for msgdoc in collection_msgdocs])
+            if delete_result:
+                for msgdoc in collection_msgdocs:
+                    msgdoc._on_deleted()
+            result.merge(delete_result)
+        return result
+
+    def _on_deleted(self) -> None:
+        action_timer.disarm(self._id)
+        document_cache.evict(self._id)
+        uow = get_unit_of_work()
+        if uow is not None:
+            uow.forget(self._id)
+        self.collection = None
+
     def json_dict(self) -> dict[str, Any]:
         return self.dict(
             exclude_none=True, exclude_defaults=True, exclude={"collection"}
@@ -83,7 +163,7 @@ class MessageDocument(Message):
         dict_obj["cb_message_info"] = self._get_dumped_message_info()
         return dict_obj
 
-    def update_message_info(
+    async def update_message_info(
         self,
         new_action: Optional[MessageAction] = MessageActions.NONE,
         new_actions: Optional[Dict[str, Any]] = None,
@@ -116,9 +196,45 @@ class MessageDocument(Message):
             else:
                 self.cb_message_info.reply_action_message_id = reply_action_message_id
 
-        updated_message_info = self._get_dumped_message_info()
-        return self.collection.update_document(
-            self._id, {"cb_message_info": updated_message_info}
+        uow = get_unit_of_work()
+        if uow is not None:
+            uow.mark_dirty(self)
+            return AppResult()
+        return await self.flush()
+
+    async def flush(self) -> AppResult:
+        return await self.flush_many((self,))
+
+    @classmethod
+    async def flush_many(cls, msgdocs: Sequence[MessageDocument]) -> AppResult:
+        result = AppResult()
+        for msgdoc in msgdocs:
+            if not msgdoc.collection:
+                msgdoc.cb_message_info.mark_clean()
+
+        for collection, collection_msgdocs in _group_by_collection(msgdocs).items():
+            updates = [
+                (msgdoc._id, *msgdoc.cb_message_info.get_changes("cb_message_info"))
+                for msgdoc in collection_msgdocs
+            ]
+            update_result = await collection.update_documents(updates)
+            if update_result:
+                for msgdoc in collection_msgdocs:
+                    msgdoc._on_flushed()
+            result.merge(update_result)
+        return result
+
+    def _on_flushed(self) -> None:
+        self.cb_message_info.mark_clean()
+        document_cache.update_message_info(self._id, self._get_dumped_message_info())
+        if self.collection is NewMessagesCollection:
+            action_timer.arm(self._id, self.cb_message_info.perform_action_at)
+
+    def is_action_due(self) -> bool:
+        perform_action_at = self.cb_message_info.perform_action_at
+        return (
+            self.collection is NewMessagesCollection
+            and 0 < perform_action_at <= int(datetime.now().timestamp())
         )
 
     def _get_dumped_message_info(self) -> dict:
@@ -141,9 +257,15 @@ class MessageDocument(Message):
     def get_from_user_data(self) -> Tuple[str, str]:
         return self.from_user.id, self.from_user.username
 
-    def _fetch_document_data(self, document_id):
-        for collection in models.collections:
-            message_data = collection.get_document(document_id)
+    @staticmethod
+    async def _fetch_document_data(document_id):
+        known_collection = document_cache.get_location(document_id)
+        collections = models.collections
+        if known_collection is not None:
+            collections = [known_collection, *(c for c in collections if c is not known_collection)]
+
+        for collection in collections:
+            message_data = await collection.get_document(document_id)
             if message_data:
                 message_data["_id"] = document_id
                 message_data["collection"] = collection
@@ -152,10 +274,20 @@ class MessageDocument(Message):
         raise Exception("Message not found")
 
     @staticmethod
-    def set_reply_action_message_id(
+    async def set_reply_action_message_id(
         document_message_id: str, action_message_id
     ) -> AppResult:
         db_key = "cb_message_info.reply_action_message_id"
-        return NewMessagesCollection.update_document(
+        return await NewMessagesCollection.update_document(
             document_message_id, {db_key: action_message_id}
         )
+
+
+def _group_by_collection(
+    msgdocs: Sequence[MessageDocument],
+) -> dict[MessagesBaseCollection, list[MessageDocument]]:
+    msgdocs_by_collection = {}
+    for msgdoc in msgdocs:
+        if msgdoc.collection:
+            msgdocs_by_collection.setdefault(msgdoc.collection, []).append(msgdoc)
+    return msgdocs_by_collection
@@ -1,6 +1,6 @@
 import logging
 import os
-from dataclasses import dataclass, field
+from dataclasses import asdict, dataclass, field
 from typing import Any, Optional
 
 from .actions import MessageActions
@@ -16,6 +16,43 @@ class SVM_MsgdocInfo:
     entities: Optional[list[dict[str, Any]]] = None
     actions: dict[str, Any] = field(default_factory=lambda: {})
 
+    def mark_clean(self) -> None:
+        self._persisted = asdict(self)
+
+    def get_changes(self, path: str) -> tuple[dict[str, Any], dict[str, Any]]:
+        to_set, to_unset = {}, {}
+        persisted = getattr(self, "_persisted", None)
+        if persisted is None:
+            to_set[path] = asdict(self)
+        else:
+            _collect_changes(path, persisted, asdict(self), to_set, to_unset)
+        return to_set, to_unset
+
+
+def _collect_changes(
+    path: str,
+    old: dict[str, Any],
+    new: dict[str, Any],
+    to_set: dict[str, Any],
+    to_unset: dict[str, Any],
+) -> None:
+    if any("." in str(key) or str(key).startswith("$") for key in (*old, *new)):
+        if old != new:
+            to_set[path] = new
+        return
+
+    for key in old.keys() - new.keys():
+        to_unset[f"{path}.{key}"] = ""
+
+    for key, value in new.items():
+        key_path = f"{path}.{key}"
+        if key not in old:
+            to_set[key_path] = value
+        elif isinstance(value, dict) and isinstance(old[key], dict) and value and old[key]:
+            _collect_changes(key_path, old[key], value, to_set, to_unset)
+        elif value != old[key]:
+            to_set[key_path] = value
+
 
 @dataclass
 class SVM_ReplyInfo(SVM_MsgdocInfo):
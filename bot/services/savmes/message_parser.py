@@ -1,5 +1,72 @@
+import logging
+import re
+from typing import Iterable
+from re import _parser as sre_parse
+
+from models import CustomMessageAction
+
 from .actions import MessageActions
 from .message_document_info import SVM_MsgdocInfo
+from .pattern_guard import pattern_quarantine
+
+logger = logging.getLogger("cerrrbot")
+
+
+class ActionsMatcher:
+    # Patterns are compiled once on plugins load. Most of them contain some literal,
+    # which any match must include (e.g. domain of site), so text is lowered once and
+    # pattern is scanned only if its literal is found there, which is much cheaper than
+    # scanning text by each pattern. Python's `re` doesn't optimize alternations, so
+    # combining patterns into one doesn't make scanning faster.
+    def __init__(self, actions: Iterable[CustomMessageAction]):
+        self._actions: list[tuple[CustomMessageAction, str]] = []
+        for action in actions:
+            if not action.regex_pattern or action.regex_pattern == "*":
+                continue
+            self._actions.append((action, _get_required_literal(action.regex_pattern)))
+
+        logger.info(
+            "Literals required by patterns of actions: {}".format(
+                {action.code: literal for action, literal in self._actions}
+            )
+        )
+
+    def match(self, text: str) -> dict[str, list[str]]:
+        # case folding of non-ASCII chars may differ from `re.IGNORECASE`
+        lowered_text = text.lower() if text.isascii() else None
+        matches = {}
+        for action, literal in self._actions:
+            matches[action.code] = []
+            if action.code in pattern_quarantine:
+                continue
+            if literal and lowered_text is not None and literal not in lowered_text:
+                continue
+
+            try:
+                matches[action.code] = action.find_all(text)
+            except TimeoutError:
+                pattern_quarantine.on_timeout(action.code)
+        return matches
+
+
+def _get_required_literal(pattern: str) -> str:
+    # longest run of ASCII literals at the top level of pattern, so it's in every match
+    try:
+        parsed = sre_parse.parse(pattern, re.IGNORECASE)
+    except re.error:
+        return ""
+
+    literal = run = ""
+    for op, value in parsed:
+        if op is sre_parse.LITERAL and value < 128:
+            run += chr(value).lower()
+            literal = max(literal, run, key=len)
+        else:
+            run = ""
+    return literal
+
+
+_matcher = ActionsMatcher(MessageActions.CUSTOM_ACTION_BY_CODE.values())
 
 
 class MessageParser:
@@ -19,7 +86,8 @@ class MessageParser:
     def parse(self) -> None:
         if not self._message_text and not self._links:
             return
+        matches = _matcher.match(self._message_text) if self._message_text else {}
         for code, action in MessageActions.CUSTOM_ACTION_BY_CODE.items():
-            found_data = action.parse(self._message_text, self._links)
+            found_data = action.parse(self._message_text, self._links, matches.get(code))
             if found_data:
                 self.actions[code] = {"data": found_data}
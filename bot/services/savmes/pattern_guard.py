@@ -0,0 +1,216 @@
+import logging
+import string
+import time
+from collections import Counter, deque
+from re import _parser as sre_parse
+from typing import Any, Optional
+
+from settings import REGEX_QUARANTINE_PERIOD, REGEX_TIMEOUTS_TO_QUARANTINE, REGEX_TIMEOUTS_WINDOW
+
+logger = logging.getLogger("cerrrbot")
+
+_REPEATS = (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT)
+# ranges wider than this are treated as matching any character
+_MAX_RANGE_SIZE = 1024
+ANY_CHAR = None
+
+_CATEGORY_CHARS = {
+    sre_parse.CATEGORY_DIGIT: frozenset(string.digits),
+    sre_parse.CATEGORY_SPACE: frozenset(string.whitespace),
+    # non-ASCII letters are represented by one of them
+    sre_parse.CATEGORY_WORD: frozenset(string.ascii_letters + string.digits + "_é"),
+}
+
+
+class PatternQuarantine:
+    # Actions whose patterns are rejected on load aren't matched anymore. Ones which
+    # exceed matching timeout several times within window are skipped for a while,
+    # since single timeout may be caused by busy process rather than by pattern.
+    def __init__(self, timeouts_to_quarantine: int, timeouts_window: float, period: float):
+        self.timeouts_to_quarantine = timeouts_to_quarantine
+        self.timeouts_window = timeouts_window
+        self.period = period
+        self._reasons: dict[str, tuple[str, Optional[float]]] = {}
+        self._recent_timeouts: dict[str, deque] = {}
+        self.timeouts: Counter = Counter()
+
+    def __contains__(self, action_code: str) -> bool:
+        try:
+            reason, until = self._reasons[action_code]
+        except KeyError:
+            return False
+
+        if until is not None and until <= time.monotonic():
+            del self._reasons[action_code]
+            logger.info("Pattern of action {} is released from quarantine".format(action_code))
+            return False
+        return True
+
+    def add(self, action_code: str, reason: str, period: Optional[float] = None) -> None:
+        until = time.monotonic() + period if period else None
+        self._reasons[action_code] = (reason, until)
+        logger.error(
+            "Pattern of action {} is quarantined{}: {}".format(
+                action_code, f" for {period}s" if period else "", reason
+            )
+        )
+
+    def on_timeout(self, action_code: str) -> None:
+        self.timeouts[action_code] += 1
+        now = time.monotonic()
+        recent = self._recent_timeouts.setdefault(action_code, deque())
+        recent.append(now)
+        while recent and recent[0] < now - self.timeouts_window:
+            recent.popleft()
+
+        logger.warning("Matching pattern of action {} timed out".format(action_code))
+        if len(recent) >= self.timeouts_to_quarantine:
+            recent.clear()
+            self.add(action_code, "matching timed out repeatedly", period=self.period)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "quarantined": {code: reason for code, (reason, _) in self._reasons.items()},
+            "timeouts": dict(self.timeouts),
+        }
+
+
+def find_pathological(pattern: str) -> Optional[str]:
+    # Quantifiers of variable length nested into unbounded one, like `(a+)+`, `(\S+\s*)*`
+    # or `(a{1,3})+`, backtrack exponentially when text doesn't match, as text can be
+    # split between iterations in many ways. Required separator which inner quantifiers
+    # can't match, like `.` in `([\w-]+\.)+`, leaves only one way, so such are fine.
+    # Patterns are parsed by `re`, so ones using `regex`-only syntax raise error here.
+    return _find_ambiguous_repeat(sre_parse.parse(pattern))
+
+
+def _find_ambiguous_repeat(items) -> Optional[str]:
+    for op, value in items:
+        if op in _REPEATS:
+            _, max_repeat, body = value
+            if max_repeat == sre_parse.MAXREPEAT and _is_ambiguous(body):
+                return "nested quantifiers without separator"
+            found = _find_ambiguous_repeat(body)
+        else:
+            found = next(filter(None, map(_find_ambiguous_repeat, _get_subpatterns(op, value))), None)
+        if found:
+            return found
+    return None
+
+
+def _is_ambiguous(body) -> bool:
+    inner_repeats = _collect_variable_repeats(body)
+    if not inner_repeats:
+        return False
+
+    repeated_chars = _union(_get_chars(subpattern) for subpattern in inner_repeats)
+    for op, value in _flatten_groups(body):
+        # only single characters are surely consumed by every iteration
+        if op in (sre_parse.LITERAL, sre_parse.IN) and not _overlap(_get_chars([(op, value)]), repeated_chars):
+            return False
+    return True
+
+
+def _flatten_groups(items) -> list:
+    flat = []
+    for op, value in items:
+        if op is sre_parse.SUBPATTERN:
+            flat.extend(_flatten_groups(value[-1]))
+        else:
+            flat.append((op, value))
+    return flat
+
+
+def _collect_variable_repeats(items) -> list:
+    repeats = []
+    for op, value in items:
+        if op in _REPEATS:
+            min_repeat, max_repeat, subpattern = value
+            if max_repeat > 1 and min_repeat != max_repeat:
+                repeats.append(subpattern)
+            else:
+                repeats.extend(_collect_variable_repeats(subpattern))
+        elif op is not sre_parse.POSSESSIVE_REPEAT:
+            # possessive quantifier doesn't backtrack
+            for subpattern in _get_subpatterns(op, value):
+                repeats.extend(_collect_variable_repeats(subpattern))
+    return repeats
+
+
+def _get_subpatterns(op, value) -> list:
+    if op is sre_parse.SUBPATTERN:
+        return [value[-1]]
+    if op is sre_parse.BRANCH:
+        return list(value[1])
+    if op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT, sre_parse.ATOMIC_GROUP, sre_parse.POSSESSIVE_REPEAT):
+        return [value[-1]]
+    return []
+
+
+def _get_chars(items) -> Optional[frozenset]:
+    # characters which items may consume, ANY_CHAR if it can't be told
+    chars = set()
+    for op, value in items:
+        if op is sre_parse.LITERAL:
+            chars.update(_with_case(chr(value)))
+        elif op is sre_parse.IN:
+            in_chars = _get_in_chars(value)
+            if in_chars is ANY_CHAR:
+                return ANY_CHAR
+            chars.update(in_chars)
+        elif op in _REPEATS:
+            sub_chars = _get_chars(value[2])
+            if sub_chars is ANY_CHAR:
+                return ANY_CHAR
+            chars.update(sub_chars)
+        elif op in (sre_parse.AT, sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            continue
+        else:
+            sub_chars = _union(_get_chars(subpattern) for subpattern in _get_subpatterns(op, value))
+            if sub_chars is ANY_CHAR or not _get_subpatterns(op, value):
+                return ANY_CHAR
+            chars.update(sub_chars)
+    return frozenset(chars)
+
+
+def _get_in_chars(items) -> Optional[frozenset]:
+    chars = set()
+    for op, value in items:
+        if op is sre_parse.NEGATE:
+            return ANY_CHAR
+        if op is sre_parse.LITERAL:
+            chars.update(_with_case(chr(value)))
+        elif op is sre_parse.RANGE:
+            low, high = value
+            if high - low > _MAX_RANGE_SIZE:
+                return ANY_CHAR
+            for code in range(low, high + 1):
+                chars.update(_with_case(chr(code)))
+        elif op is sre_parse.CATEGORY and value in _CATEGORY_CHARS:
+            chars.update(_CATEGORY_CHARS[value])
+        else:
+            return ANY_CHAR
+    return frozenset(chars)
+
+
+def _with_case(char: str) -> set[str]:
+    # actions' patterns are compiled case-insensitive
+    return {char, char.lower(), char.upper()}
+
+
+def _union(chars_sets) -> Optional[frozenset]:
+    union = set()
+    for chars in chars_sets:
+        if chars is ANY_CHAR:
+            return ANY_CHAR
+        union.update(chars)
+    return frozenset(union)
+
+
+def _overlap(chars: Optional[frozenset], other: Optional[frozenset]) -> bool:
+    return chars is ANY_CHAR or other is ANY_CHAR or bool(chars & other)
+
+
+pattern_quarantine = PatternQuarantine(
+    REGEX_TIMEOUTS_TO_QUARANTINE, REGEX_TIMEOUTS_WINDOW, REGEX_QUARANTINE_PERIOD
+)
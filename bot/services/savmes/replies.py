@@ -0,0 +1,82 @@
+import logging
+from typing import Any, Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.filters.callback_data import CallbackData
+from aiogram.types import CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+
+from constants import CUSTOM_MESSAGE_MIN_ORDER
+from models import MessageAction
+from telegram_gateway import telegram_gateway
+
+from .keyboard_edits import keyboard_edits
+
+logger = logging.getLogger("cerrrbot")
+
+
+class SaveMessageData(CallbackData, prefix="SVM"):
+    action: str
+    msgdoc_id: str
+
+
+async def process_performed_action_result(
+    msgdoc_id: str, result: Dict[str, Any],
+    query: Optional[CallbackQuery] = None,
+    bot: Optional[Bot] = None, chat_id: Optional[int] = None,
+    message_id: Optional[int] = None
+) -> None:
+
+    try:
+        reply_info = result.data["reply_info"]
+    except (AttributeError, KeyError):
+        reply_info = None
+        pass
+
+    if query:
+        # query is answered even without popup, so client stops showing progress
+        popup_text = reply_info.popup_text if reply_info else None
+        await telegram_gateway.call(bot, query.answer(popup_text))
+
+    if not (reply_info and reply_info.actions):
+        return
+
+    next_markup = build_message_actions_menu_kb(reply_info.actions, msgdoc_id)
+
+    if query:
+        if reply_info.need_edit_buttons:
+            keyboard_edits.schedule(
+                bot, query.message.chat.id, query.message.message_id, next_markup
+            )
+        return
+
+    message_id = message_id or reply_info.reply_action_message_id
+    if not message_id or not reply_info.need_edit_buttons:
+        return
+    keyboard_edits.schedule(bot, chat_id, message_id, next_markup)
+
+
+def build_message_actions_menu_kb(
+    reply_actions: List[MessageAction], msgdoc_id: str
+) -> InlineKeyboardMarkup:
+
+    kb_builder = InlineKeyboardBuilder()
+    actions_buttons = []
+    custom_actions_buttons = {}
+    for action in reply_actions:
+        button = InlineKeyboardButton(
+            text=action.caption,
+            callback_data=SaveMessageData(
+                action=action.code,
+                msgdoc_id=msgdoc_id,
+            ).pack(),
+        )
+        if action.order >= CUSTOM_MESSAGE_MIN_ORDER:
+            custom_actions_buttons.setdefault(action.order // 100, []).append(button)
+        else:
+            actions_buttons.append(button)
+    kb_builder.row(*actions_buttons)
+    for buttons in custom_actions_buttons.values():
+        kb_builder.row(*buttons)
+
+    return kb_builder.as_markup()
@@ -0,0 +1,132 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Iterable, Optional
+
+import orjson as json
+from celery import states
+
+from repositories import cache
+
+logger = logging.getLogger("cerrrbot")
+
+TASK_META_KEY_PREFIX = "celery-task-meta-"
+
+
+class TaskListener:
+    # celery's redis backend publishes task meta to channel named same as its key
+    # on every stored state, so finished tasks are pushed to bot instead of polled;
+    # tasks finished while listener wasn't subscribed are found by batched lookups
+    def __init__(self):
+        self._watched: dict[str, str] = {}
+        self._to_check: set[str] = set()
+        self._check_event = asyncio.Event()
+        self._handler: Optional[Callable[[str, str, str], Awaitable]] = None
+        self._tasks: list[asyncio.Task] = []
+        self._fired_tasks: set[asyncio.Task] = set()
+
+    def watch(self, task_id: str, msgdoc_id: str) -> None:
+        self._watched[task_id] = msgdoc_id
+        self._to_check.add(task_id)
+        self._check_event.set()
+
+    def forget(self, task_id: str) -> None:
+        self._watched.pop(task_id, None)
+
+    def __len__(self) -> int:
+        return len(self._watched)
+
+    async def get_statuses(self, task_ids: Iterable[str]) -> dict[str, str]:
+        task_ids = list(task_ids)
+        if not task_ids:
+            return {}
+
+        client = await cache.get_backend_client()
+        values = await client.mget([f"{TASK_META_KEY_PREFIX}{task_id}" for task_id in task_ids])
+        return {
+            task_id: _get_status(value) if value else states.PENDING
+            for task_id, value in zip(task_ids, values)
+        }
+
+    async def get_result(self, task_id: str) -> Any:
+        client = await cache.get_backend_client()
+        task_meta = await client.get(f"{TASK_META_KEY_PREFIX}{task_id}")
+        return json.loads(task_meta).get("result") if task_meta else None
+
+    def start(self, handler: Callable[[str, str, str], Awaitable]) -> None:
+        self._handler = handler
+        self._tasks = [asyncio.create_task(self._listen()), asyncio.create_task(self._check())]
+        logger.info("Task listener started")
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, *self._fired_tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                client = await cache.get_backend_client()
+                pubsub = client.pubsub(ignore_subscribe_messages=True)
+                try:
+                    await pubsub.psubscribe(f"{TASK_META_KEY_PREFIX}*")
+                    # states stored before subscription would be missed otherwise
+                    self._to_check.update(self._watched)
+                    self._check_event.set()
+                    async for message in pubsub.listen():
+                        task_id = message["channel"].decode()[len(TASK_META_KEY_PREFIX):]
+                        if task_id in self._watched:
+                            self._on_status(task_id, _get_status(message["data"]))
+                finally:
+                    await pubsub.reset()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning("Task listener failed: {}".format(exc))
+                await asyncio.sleep(1)
+
+    async def _check(self) -> None:
+        while True:
+            await self._check_event.wait()
+            self._check_event.clear()
+            task_ids = self._to_check & self._watched.keys()
+            self._to_check.clear()
+            try:
+                statuses = await self.get_statuses(task_ids)
+            except Exception as exc:
+                logger.warning("Failed to check tasks statuses: {}".format(exc))
+                self._to_check.update(task_ids)
+                await asyncio.sleep(1)
+                continue
+
+            for task_id, status in statuses.items():
+                self._on_status(task_id, status)
+
+    def _on_status(self, task_id: str, status: str) -> None:
+        if status not in states.READY_STATES:
+            return
+
+        msgdoc_id = self._watched.pop(task_id, None)
+        if msgdoc_id is None:
+            return
+
+        logger.info("[{}] Task {} finished: {}".format(msgdoc_id, task_id, status))
+        task = asyncio.create_task(self._perform(task_id, msgdoc_id, status))
+        self._fired_tasks.add(task)
+        task.add_done_callback(self._fired_tasks.discard)
+
+    async def _perform(self, task_id: str, msgdoc_id: str, status: str) -> None:
+        try:
+            await self._handler(task_id, msgdoc_id, status)
+        except Exception as exc:
+            logger.exception("[{}] Failed to handle finished task {}: {}".format(msgdoc_id, task_id, exc))
+
+
+def _get_status(task_meta: bytes) -> str:
+    try:
+        return json.loads(task_meta)["status"]
+    except Exception:
+        return states.PENDING
+
+
+task_listener = TaskListener()
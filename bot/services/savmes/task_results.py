@@ -0,0 +1,99 @@
+import hashlib
+import logging
+import time
+from typing import Any, Optional
+
+import orjson as json
+
+from constants import CACHE_KEY_PREFIX_TASK_RESULT
+from models import CustomMessageAction
+from repositories import cache
+from settings import TASK_RESULT_CACHE_MAX_ENTRIES
+from task_executor import get_plugin_name
+
+logger = logging.getLogger("cerrrbot")
+
+# results are kept in string keys with TTL of action, recency of keys is tracked
+# in sorted set, so least recently used ones are evicted when there are too many
+LRU_INDEX_KEY = f"{CACHE_KEY_PREFIX_TASK_RESULT}_lru"
+STATS_KEY = f"{CACHE_KEY_PREFIX_TASK_RESULT}_stats"
+
+
+class TaskResultCache:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+
+    @staticmethod
+    def is_enabled(action: CustomMessageAction) -> bool:
+        # cache hit doesn't run task, so only tasks whose result is all they produce
+        # (no messages sent, files stored, etc.) may be cached
+        return bool(action.method_args.get("cache_ttl")) and action.method_args.get("side_effects") is False
+
+    @staticmethod
+    def get_key(action: CustomMessageAction, task_args: Any) -> str:
+        normalized = _normalize(task_args)
+        digest = hashlib.sha256(json.dumps(normalized, option=json.OPT_SORT_KEYS)).hexdigest()
+        return f"{CACHE_KEY_PREFIX_TASK_RESULT}:{action.code}:{digest}"
+
+    async def get(self, action: CustomMessageAction, task_args: Any) -> Optional[dict[str, Any]]:
+        key = self.get_key(action, task_args)
+        plugin_name = get_plugin_name(action.method_args["task_name"])
+        client = await cache.get_client()
+        cached = await client.get(key)
+        async with client.pipeline(transaction=False) as pipe:
+            if cached is None:
+                pipe.zrem(LRU_INDEX_KEY, key)
+                pipe.hincrby(STATS_KEY, f"{plugin_name}:misses", 1)
+            else:
+                pipe.zadd(LRU_INDEX_KEY, {key: time.time()})
+                pipe.hincrby(STATS_KEY, f"{plugin_name}:hits", 1)
+            await pipe.execute()
+
+        if cached is None:
+            return None
+        logger.info("[{}] Reused cached task result: {}".format(action.code, key))
+        return json.loads(cached)
+
+    async def put(self, action: CustomMessageAction, task_args: Any, task_result: Any) -> None:
+        key = self.get_key(action, task_args)
+        try:
+            value = json.dumps({"result": task_result})
+        except TypeError:
+            value = json.dumps({"result": None})
+
+        client = await cache.get_client()
+        async with client.pipeline(transaction=True) as pipe:
+            pipe.set(key, value, ex=int(action.method_args["cache_ttl"]))
+            pipe.zadd(LRU_INDEX_KEY, {key: time.time()})
+            pipe.zcard(LRU_INDEX_KEY)
+            *_, entries = await pipe.execute()
+
+        if entries > self.max_entries:
+            evicted = await client.zpopmin(LRU_INDEX_KEY, entries - self.max_entries)
+            if evicted:
+                await client.delete(*(evicted_key for evicted_key, _ in evicted))
+                logger.debug("Evicted {} cached task results".format(len(evicted)))
+
+    async def stats(self) -> dict[str, dict[str, int]]:
+        client = await cache.get_client()
+        stats = {}
+        for field, value in (await client.hgetall(STATS_KEY)).items():
+            plugin_name, counter = field.decode().rsplit(":", 1)
+            stats.setdefault(plugin_name, {"hits": 0, "misses": 0})[counter] = int(value)
+        return stats
+
+
+def _normalize(task_args: Any) -> Any:
+    # same matches found in different order or with surrounding spaces are same input
+    if isinstance(task_args, str):
+        return task_args.strip()
+    if isinstance(task_args, (list, tuple, set)):
+        return sorted(
+            {json.dumps(_normalize(arg), option=json.OPT_SORT_KEYS).decode() for arg in task_args}
+        )
+    if isinstance(task_args, dict):
+        return {str(key): _normalize(value) for key, value in task_args.items()}
+    return task_args
+
+
+task_result_cache = TaskResultCache(TASK_RESULT_CACHE_MAX_ENTRIES)
@@ -0,0 +1,139 @@
+import copy
+import logging
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from common import AppResult, LRUCache
+from models import MessagesBaseCollection
+from settings import MSGDOC_CACHE_SIZE, MSGDOC_CACHE_TTL, MSGDOC_LOCATION_CACHE_SIZE
+
+logger = logging.getLogger("cerrrbot")
+
+
+class UnitOfWork:
+    def __init__(self):
+        self.identity_map: dict[str, Any] = {}
+        self.closed = False
+        self._dirty: dict[str, Any] = {}
+        self._after_flush: list[Callable[[], Any]] = []
+
+    def mark_dirty(self, msgdoc: Any) -> None:
+        self._dirty[msgdoc._id] = msgdoc
+
+    def forget(self, document_id: str) -> None:
+        self.identity_map.pop(document_id, None)
+        self._dirty.pop(document_id, None)
+
+    def after_flush(self, callback: Callable[[], Any]) -> None:
+        self._after_flush.append(callback)
+
+    async def flush(self) -> AppResult:
+        result = AppResult()
+        if self._dirty:
+            msgdocs = list(self._dirty.values())
+            self._dirty.clear()
+            result = await type(msgdocs[0]).flush_many(msgdocs)
+            if not result:
+                logger.error(
+                    "Failed to flush message info of {}: {}".format([m._id for m in msgdocs], result)
+                )
+                return result
+
+        callbacks, self._after_flush = self._after_flush, []
+        for callback in callbacks:
+            callback()
+        return result
+
+
+class FlushError(Exception):
+    # deferred writes failed, so whatever was reported within unit of work didn't persist
+    def __init__(self, result: AppResult):
+        super().__init__("Failed to flush unit of work: {}".format(result.info))
+        self.result = result
+
+
+_unit_of_work: ContextVar[Optional[UnitOfWork]] = ContextVar("msgdoc_unit_of_work", default=None)
+
+
+@asynccontextmanager
+async def unit_of_work() -> AsyncIterator[UnitOfWork]:
+    uow = UnitOfWork()
+    token = _unit_of_work.set(uow)
+    try:
+        yield uow
+        # changes are flushed only if work is finished, half-applied ones are dropped
+        result = await uow.flush()
+        if not result:
+            raise FlushError(result)
+    finally:
+        uow.closed = True
+        _unit_of_work.reset(token)
+
+
+def get_unit_of_work() -> Optional[UnitOfWork]:
+    # tasks spawned from handler copy its context, so they may see finished unit of work
+    uow = _unit_of_work.get()
+    return uow if uow is not None and not uow.closed else None
+
+
+def run_after_flush(callback: Callable[[], Any]) -> None:
+    # for side effects which must not be seen before changes are stored
+    uow = get_unit_of_work()
+    if uow is not None:
+        uow.after_flush(callback)
+    else:
+        callback()
+
+
+class UnitOfWorkMiddleware(BaseMiddleware):
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        async with unit_of_work():
+            return await handler(event, data)
+
+
+class MessageDocumentCache:
+    # raw documents are kept, so every update gets its own MessageDocument object
+    def __init__(self):
+        self._documents = LRUCache(MSGDOC_CACHE_SIZE, ttl=MSGDOC_CACHE_TTL)
+        self._locations = LRUCache(MSGDOC_LOCATION_CACHE_SIZE)
+
+    def get(self, document_id: str) -> Optional[dict[str, Any]]:
+        document_data = self._documents.get(document_id)
+        return copy.deepcopy(document_data) if document_data else None
+
+    def get_location(self, document_id: str) -> Optional[MessagesBaseCollection]:
+        return self._locations.get(document_id)
+
+    def put(self, document_id: str, document_data: dict[str, Any]) -> None:
+        self._documents.put(document_id, copy.deepcopy(document_data))
+        self._locations.put(document_id, document_data["collection"])
+
+    def update_message_info(self, document_id: str, message_info: dict[str, Any]) -> None:
+        document_data = self._documents.get(document_id, count=False)
+        if document_data:
+            document_data["cb_message_info"] = copy.deepcopy(message_info)
+
+    def move(self, document_id: str, collection: MessagesBaseCollection) -> None:
+        document_data = self._documents.get(document_id, count=False)
+        if document_data:
+            document_data["collection"] = collection
+        self._locations.put(document_id, collection)
+
+    def evict(self, document_id: str) -> None:
+        self._documents.pop(document_id)
+        self._locations.pop(document_id)
+
+    def stats(self) -> dict[str, Any]:
+        return {"documents": self._documents.stats(), "locations": self._locations.stats()}
+
+
+document_cache = MessageDocumentCache()
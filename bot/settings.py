@@ -25,6 +25,14 @@ TOKEN = config("BOT_TOKEN")
 MONGO_DB_HOST = config("CERRRBOT_MONGO_HOST", default="localhost")
 MONGO_DB_PORT = config("CERRRBOT_MONGO_PORT", default=27017, cast=int)
 MONGO_DB_NAME = config("CERRRBOT_MONGO_DB_NAME", default="cerrrbot_mongo")
+MONGO_MAX_POOL_SIZE = config("CERRRBOT_MONGO_MAX_POOL_SIZE", default=20, cast=int)
+MONGO_MIN_POOL_SIZE = config("CERRRBOT_MONGO_MIN_POOL_SIZE", default=0, cast=int)
+MONGO_MAX_IDLE_TIME_MS = config("CERRRBOT_MONGO_MAX_IDLE_TIME_MS", default=60000, cast=int)
+MONGO_WAIT_QUEUE_TIMEOUT_MS = config("CERRRBOT_MONGO_WAIT_QUEUE_TIMEOUT_MS", default=5000, cast=int)
+MONGO_SERVER_SELECTION_TIMEOUT_MS = config(
+    "CERRRBOT_MONGO_SERVER_SELECTION_TIMEOUT_MS", default=2000, cast=int
+)
+MONGO_CONNECT_TIMEOUT_MS = config("CERRRBOT_MONGO_CONNECT_TIMEOUT_MS", default=15000, cast=int)
 
 REDIS_HOST = config("CERRRBOT_REDIS_HOST", default="localhost")
 REDIS_PORT = config("CERRRBOT_REDIS_PORT", default=6379, cast=int)
@@ -41,7 +49,7 @@ TIMEOUT_BEFORE_PERFORMING_DEFAULT_ACTION = config(
 
 DEFAULT_CHECK_FOR_NEW_MESSAGES_TIMEOUT = config(
     "DEFAULT_CHECK_FOR_NEW_MESSAGES_TIMEOUT",
-    default=3, cast=int
+    default=60, cast=int
 )
 
 DEFAULT_CHECK_FOR_DEPRECATED_MESSAGES_TIMEOUT = config(
@@ -50,11 +58,75 @@ DEFAULT_CHECK_FOR_DEPRECATED_MESSAGES_TIMEOUT = config(
 )
 
 
+DOWNLOAD_MAX_CONCURRENCY = config("CERRRBOT_DOWNLOAD_MAX_CONCURRENCY", default=8, cast=int)
+DOWNLOAD_MAX_CHAT_CONCURRENCY = config("CERRRBOT_DOWNLOAD_MAX_CHAT_CONCURRENCY", default=4, cast=int)
+DOWNLOAD_RETRIES = config("CERRRBOT_DOWNLOAD_RETRIES", default=3, cast=int)
+DOWNLOAD_RETRY_BACKOFF = config("CERRRBOT_DOWNLOAD_RETRY_BACKOFF", default=1.0, cast=float)
+DOWNLOAD_CHUNK_SIZE = config("CERRRBOT_DOWNLOAD_CHUNK_SIZE", default=256 * 1024, cast=int)
+DOWNLOAD_WRITE_BUFFER_CHUNKS = config("CERRRBOT_DOWNLOAD_WRITE_BUFFER_CHUNKS", default=8, cast=int)
+DOWNLOAD_TIMEOUT = config("CERRRBOT_DOWNLOAD_TIMEOUT", default=300, cast=int)
+FS_WORKERS = config("CERRRBOT_FS_WORKERS", default=4, cast=int)
+
+INSTANT_TASKS_EXECUTOR = config(
+    "CERRRBOT_INSTANT_TASKS_EXECUTOR", default="thread", cast=lambda v: v.lower()
+)
+assert INSTANT_TASKS_EXECUTOR in ("thread", "process"), f"Unknown executor: {INSTANT_TASKS_EXECUTOR}"
+INSTANT_TASKS_WORKERS = config("CERRRBOT_INSTANT_TASKS_WORKERS", default=4, cast=int)
+INSTANT_TASKS_TIMEOUT = config("CERRRBOT_INSTANT_TASKS_TIMEOUT", default=30, cast=float)
+INSTANT_TASKS_PLUGIN_CONCURRENCY = config("CERRRBOT_INSTANT_TASKS_PLUGIN_CONCURRENCY", default=2, cast=int)
+
+TELEGRAM_GLOBAL_RATE = config("CERRRBOT_TELEGRAM_GLOBAL_RATE", default=25, cast=float)
+TELEGRAM_GLOBAL_BURST = config("CERRRBOT_TELEGRAM_GLOBAL_BURST", default=30, cast=float)
+TELEGRAM_CHAT_RATE = config("CERRRBOT_TELEGRAM_CHAT_RATE", default=1, cast=float)
+TELEGRAM_CHAT_BURST = config("CERRRBOT_TELEGRAM_CHAT_BURST", default=5, cast=float)
+TELEGRAM_GATEWAY_WORKERS = config("CERRRBOT_TELEGRAM_GATEWAY_WORKERS", default=4, cast=int)
+TELEGRAM_MAX_RETRIES = config("CERRRBOT_TELEGRAM_MAX_RETRIES", default=3, cast=int)
+CALLBACK_ANSWER_WAIT = config("CERRRBOT_CALLBACK_ANSWER_WAIT", default=0.5, cast=float)
+KEYBOARD_EDIT_WINDOW = config("CERRRBOT_KEYBOARD_EDIT_WINDOW", default=0.3, cast=float)
+KEYBOARD_EDIT_CACHE_SIZE = config("CERRRBOT_KEYBOARD_EDIT_CACHE_SIZE", default=1024, cast=int)
+# base URL of self-hosted (or fake, for benchmarks) Bot API server
+TELEGRAM_API_SERVER = config("CERRRBOT_TELEGRAM_API_SERVER", default="")
+
+UPDATES_MAX_CONCURRENCY = config("CERRRBOT_UPDATES_MAX_CONCURRENCY", default=16, cast=int)
+UPDATES_MAX_PENDING = config("CERRRBOT_UPDATES_MAX_PENDING", default=1000, cast=int)
+# "polling" or "webhook"
+UPDATES_MODE = config("CERRRBOT_UPDATES_MODE", default="polling")
+WEBHOOK_URL = config("CERRRBOT_WEBHOOK_URL", default="")
+WEBHOOK_HOST = config("CERRRBOT_WEBHOOK_HOST", default="0.0.0.0")
+WEBHOOK_PORT = config("CERRRBOT_WEBHOOK_PORT", default=8080, cast=int)
+WEBHOOK_PATH = config("CERRRBOT_WEBHOOK_PATH", default="/webhook")
+WEBHOOK_SECRET = config("CERRRBOT_WEBHOOK_SECRET", default="")
+WEBHOOK_QUEUE_SIZE = config("CERRRBOT_WEBHOOK_QUEUE_SIZE", default=1000, cast=int)
+WEBHOOK_QUEUE_TIMEOUT = config("CERRRBOT_WEBHOOK_QUEUE_TIMEOUT", default=5, cast=float)
+WEBHOOK_WORKERS = config("CERRRBOT_WEBHOOK_WORKERS", default=16, cast=int)
+
+REGEX_MATCH_TIMEOUT = config("CERRRBOT_REGEX_MATCH_TIMEOUT", default=0.05, cast=float)
+REGEX_TIMEOUTS_TO_QUARANTINE = config("CERRRBOT_REGEX_TIMEOUTS_TO_QUARANTINE", default=3, cast=int)
+REGEX_TIMEOUTS_WINDOW = config("CERRRBOT_REGEX_TIMEOUTS_WINDOW", default=300, cast=float)
+REGEX_QUARANTINE_PERIOD = config("CERRRBOT_REGEX_QUARANTINE_PERIOD", default=600, cast=float)
+
+CELERY_QUEUE_INTERACTIVE = config("CERRRBOT_CELERY_QUEUE_INTERACTIVE", default="interactive")
+CELERY_QUEUE_BULK = config("CERRRBOT_CELERY_QUEUE_BULK", default="bulk")
+TASK_RESULT_CACHE_MAX_ENTRIES = config("CERRRBOT_TASK_RESULT_CACHE_MAX_ENTRIES", default=1000, cast=int)
+CELERY_PAYLOAD_BY_REFERENCE = config("CERRRBOT_CELERY_PAYLOAD_BY_REFERENCE", default=False, cast=bool)
+CELERY_MSGDOC_CACHE_SIZE = config("CERRRBOT_CELERY_MSGDOC_CACHE_SIZE", default=1024, cast=int)
+CELERY_MSGDOC_CACHE_TTL = config("CERRRBOT_CELERY_MSGDOC_CACHE_TTL", default=60, cast=int)
+
+MSGDOC_CACHE_SIZE = config("CERRRBOT_MSGDOC_CACHE_SIZE", default=256, cast=int)
+MSGDOC_CACHE_TTL = config("CERRRBOT_MSGDOC_CACHE_TTL", default=300, cast=int)
+MSGDOC_LOCATION_CACHE_SIZE = config("CERRRBOT_MSGDOC_LOCATION_CACHE_SIZE", default=4096, cast=int)
+
+
 PLUGINS_MODULE_NAME = config(
     "PLUGINS_MODULE_NAME", default="plugins"
 )
 
+DEFAULT_CACHE_KEY_PREFIX_TASK_RESULT = config("DEFAULT_CACHE_KEY_PREFIX_TASK_RESULT", default="cerrrbot_task_result")
 DEFAULT_CACHE_KEY_PREFIX_NOTIFICATION = config("DEFAULT_CACHE_KEY_PREFIX_NOTIFICATION", default="cerrrbot_notification")
+DEFAULT_NOTIFICATIONS_BATCH_SIZE = config("CERRRBOT_NOTIFICATIONS_BATCH_SIZE", default=100, cast=int)
+DEFAULT_NOTIFICATIONS_CLAIM_TIMEOUT = config("CERRRBOT_NOTIFICATIONS_CLAIM_TIMEOUT", default=300, cast=int)
+DEFAULT_NOTIFICATIONS_MERGE_WINDOW = config("CERRRBOT_NOTIFICATIONS_MERGE_WINDOW", default=60, cast=int)
+DEFAULT_NOTIFICATIONS_MAX_CONCURRENCY = config("CERRRBOT_NOTIFICATIONS_MAX_CONCURRENCY", default=8, cast=int)
 
 
 PLUGINS_DIR_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), PLUGINS_MODULE_NAME)
@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import multiprocessing
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from functools import partial
+from typing import Any, Optional
+
+from common import AppResult
+from settings import (
+    INSTANT_TASKS_EXECUTOR,
+    INSTANT_TASKS_PLUGIN_CONCURRENCY,
+    INSTANT_TASKS_TIMEOUT,
+    INSTANT_TASKS_WORKERS,
+)
+
+logger = logging.getLogger("cerrrbot")
+
+
+@dataclass
+class TaskStats:
+    calls: int = 0
+    failed: int = 0
+    timed_out: int = 0
+    total_wait: float = 0
+    total_run: float = 0
+    max_run: float = 0
+
+    def as_dict(self) -> dict[str, Any]:
+        stats = asdict(self)
+        finished = self.calls - self.timed_out
+        stats["avg_run"] = self.total_run / finished if finished else 0
+        stats["avg_wait"] = self.total_wait / self.calls if self.calls else 0
+        return stats
+
+
+class TaskExecutor:
+    # instant plugin tasks are run off the event loop, so they don't stall other updates.
+    # Started thread or process can't be interrupted, so on timeout handler gets result
+    # right away, but plugin's slot is released only when task really finishes.
+    def __init__(self, kind: str, workers: int, plugin_concurrency: int, timeout: float):
+        self.kind = kind
+        self.workers = workers
+        self.plugin_concurrency = plugin_concurrency
+        self.timeout = timeout
+        self._executor: Optional[Executor] = None
+        self._semaphores: dict[str, asyncio.Semaphore] = {}
+        self._stats: dict[str, TaskStats] = {}
+
+    async def run(
+        self,
+        task_name: str,
+        task_args: Any,
+        msgdoc: Any,
+        timeout: Optional[float] = None,
+    ) -> AppResult:
+        stats = self._stats.setdefault(task_name, TaskStats())
+        stats.calls += 1
+        semaphore = self._semaphores.setdefault(
+            get_plugin_name(task_name), asyncio.Semaphore(self.plugin_concurrency)
+        )
+
+        queued_at = time.monotonic()
+        await semaphore.acquire()
+        started_at = time.monotonic()
+        stats.total_wait += started_at - queued_at
+
+        try:
+            future = self._submit(task_name, task_args, msgdoc)
+        except Exception as exc:
+            semaphore.release()
+            stats.failed += 1
+            logger.exception(exc)
+            return AppResult(False, exc)
+        future.add_done_callback(lambda _: semaphore.release())
+        future.add_done_callback(partial(self._on_finished, task_name, started_at))
+
+        try:
+            result = await asyncio.wait_for(asyncio.shield(future), timeout or self.timeout)
+        except asyncio.TimeoutError:
+            stats.timed_out += 1
+            logger.warning("Instant task {} timed out, it keeps running in background".format(task_name))
+            return AppResult(False, "Task timed out")
+        except asyncio.CancelledError:
+            # not started yet task is dropped, started one can only be waited for
+            future.cancel()
+            raise
+        except Exception as exc:
+            logger.exception("Instant task {} failed: {}".format(task_name, exc))
+            return AppResult(False, exc)
+
+        if isinstance(result, AppResult):
+            return result
+        return AppResult(data={"task_result": result})
+
+    def stats(self) -> dict[str, dict[str, Any]]:
+        return {task_name: stats.as_dict() for task_name, stats in self._stats.items()}
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            logger.info("Instant tasks stats: {}".format(self.stats()))
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _submit(self, task_name: str, task_args: Any, msgdoc: Any) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        if self.kind == "process":
+            # objects can't be shared with other process, so task gets document's data
+            call = partial(_run_task, task_name, task_args, msgdoc.json_dict())
+        else:
+            call = partial(_run_task, task_name, task_args, msgdoc)
+        return loop.run_in_executor(self._get_executor(), call)
+
+    def _on_finished(self, task_name: str, started_at: float, future: asyncio.Future) -> None:
+        stats = self._stats[task_name]
+        if future.cancelled():
+            return
+
+        run_time = time.monotonic() - started_at
+        stats.total_run += run_time
+        stats.max_run = max(stats.max_run, run_time)
+        if future.exception() is not None:
+            stats.failed += 1
+        logger.debug("Instant task {} finished in {:.3f}s".format(task_name, run_time))
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                # bot process runs event loop and client pools, so workers aren't forked from it
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="cerrrbot-task"
+                )
+        return self._executor
+
+
+def get_plugin_name(task_name: str) -> str:
+    # tasks are named as `plugins.<PLUGIN_NAME>.tasks.<Task>`
+    parts = task_name.split(".")
+    return parts[1] if len(parts) > 2 else task_name
+
+
+def _run_task(task_name: str, task_args: Any, msgdoc: Any) -> Any:
+    from celery_app import app
+
+    return app.tasks[task_name](task_args, msgdoc)
+
+
+task_executor = TaskExecutor(
+    INSTANT_TASKS_EXECUTOR,
+    INSTANT_TASKS_WORKERS,
+    INSTANT_TASKS_PLUGIN_CONCURRENCY,
+    INSTANT_TASKS_TIMEOUT,
+)
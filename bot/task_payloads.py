@@ -0,0 +1,71 @@
+import copy
+import logging
+from typing import Any, Optional
+
+import models
+from common import LRUCache
+from repositories import db
+from settings import CELERY_MSGDOC_CACHE_SIZE, CELERY_MSGDOC_CACHE_TTL
+
+logger = logging.getLogger("cerrrbot")
+
+REFERENCE_KEY = "__msgdoc_ref__"
+
+
+def make_reference(document_id: str, collection_name: str) -> dict[str, str]:
+    # sent to celery instead of whole message document, worker reads it from DB by itself
+    return {REFERENCE_KEY: document_id, "collection": collection_name}
+
+
+def is_reference(payload: Any) -> bool:
+    return isinstance(payload, dict) and REFERENCE_KEY in payload
+
+
+class DocumentReader:
+    # read-through cache in front of `db`, shared by all tasks of worker process;
+    # documents may be up to TTL stale, which is fine for plugins reading message content
+    def __init__(self, maxsize: int, ttl: float):
+        self._documents = LRUCache(maxsize, ttl=ttl)
+
+    def get(self, reference: dict[str, str]) -> Optional[dict[str, Any]]:
+        document_id = reference[REFERENCE_KEY]
+        document = self._documents.get(document_id)
+        if document is None:
+            document = self._fetch(document_id, reference.get("collection"))
+            if document is not None:
+                self._documents.put(document_id, document)
+        # every task gets its own copy, so plugin changing it doesn't affect others
+        return copy.deepcopy(document)
+
+    def stats(self) -> dict[str, Any]:
+        return self._documents.stats()
+
+    def _fetch(self, document_id: str, collection_name: Optional[str]) -> Optional[dict[str, Any]]:
+        # message may be moved to another collection after task was sent
+        collections_names = [c.name for c in models.collections if c.name != collection_name]
+        if collection_name:
+            collections_names.insert(0, collection_name)
+
+        for name in collections_names:
+            documents = db.select(name, document_id)
+            if documents:
+                document = documents[0]
+                document["_id"] = str(document["_id"])
+                return document
+
+        logger.warning("Referenced document not found: {}".format(document_id))
+        return None
+
+
+document_reader = DocumentReader(CELERY_MSGDOC_CACHE_SIZE, CELERY_MSGDOC_CACHE_TTL)
+
+
+class ReferencePayloadMixin:
+    # mixed into plugin tasks on registration, so they get document data either way
+    def __call__(self, task_args: Any, msgdoc: Any, *args, **kwargs) -> Any:
+        if is_reference(msgdoc):
+            document = document_reader.get(msgdoc)
+            if document is None:
+                raise LookupError("Message document is gone: {}".format(msgdoc[REFERENCE_KEY]))
+            msgdoc = document
+        return super().__call__(task_args, msgdoc, *args, **kwargs)
@@ -0,0 +1,256 @@
+import asyncio
+import itertools
+import logging
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Any, Awaitable, Callable, Optional
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+from aiogram.types import TelegramObject
+
+from settings import (
+    TELEGRAM_CHAT_BURST,
+    TELEGRAM_CHAT_RATE,
+    TELEGRAM_GATEWAY_WORKERS,
+    TELEGRAM_GLOBAL_BURST,
+    TELEGRAM_GLOBAL_RATE,
+    TELEGRAM_MAX_RETRIES,
+)
+
+logger = logging.getLogger("cerrrbot")
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    BACKGROUND = 1
+
+
+# calls made while handling update are interactive, others (timers, sweeps, notifications,
+# background downloads) are background, unless priority is passed explicitly
+_priority: ContextVar[Priority] = ContextVar("telegram_call_priority", default=Priority.BACKGROUND)
+
+
+def set_background_priority() -> None:
+    _priority.set(Priority.BACKGROUND)
+
+
+class InteractivePriorityMiddleware(BaseMiddleware):
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        token = _priority.set(Priority.INTERACTIVE)
+        try:
+            return await handler(event, data)
+        finally:
+            _priority.reset(token)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def get_delay(self) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def consume(self) -> None:
+        self.tokens -= 1
+
+
+@dataclass
+class _Request:
+    bot: Bot
+    method: TelegramMethod
+    chat_id: Optional[int | str]
+    priority: Priority
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.monotonic)
+    attempts: int = 0
+
+
+class TelegramGateway:
+    # All Bot API calls go through prioritized queue and are sent by few workers within
+    # global and per-chat limits of Telegram. Request whose chat is throttled or under
+    # flood wait is put aside until it's allowed, so it doesn't hold up other chats.
+    def __init__(
+        self,
+        global_rate: float,
+        global_burst: float,
+        chat_rate: float,
+        chat_burst: float,
+        workers: int,
+        max_retries: int,
+    ):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.workers = workers
+        self.max_retries = max_retries
+        self._global_bucket = TokenBucket(global_rate, global_burst)
+        self._global_blocked_until = 0.0
+        self._chat_buckets: dict[int | str, TokenBucket] = {}
+        self._chat_blocked_until: dict[int | str, float] = {}
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._sequence = itertools.count()
+        self._workers: list[asyncio.Task] = []
+        self._pending: set[asyncio.Future] = set()
+        self._delayed = 0
+        self._stats = {"calls": 0, "failed": 0, "throttled": 0, "retry_after": 0, "total_wait": 0.0}
+
+    async def call(
+        self, bot: Bot, method: TelegramMethod, priority: Optional[Priority] = None
+    ) -> Any:
+        if not self._workers:
+            return await bot(method)
+
+        request = _Request(
+            bot=bot,
+            method=method,
+            chat_id=getattr(method, "chat_id", None),
+            priority=_priority.get() if priority is None else priority,
+            future=asyncio.get_running_loop().create_future(),
+        )
+        self._pending.add(request.future)
+        request.future.add_done_callback(self._pending.discard)
+        self._put(request)
+        return await request.future
+
+    def start(self) -> None:
+        self._queue = asyncio.PriorityQueue()
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        logger.info("Telegram gateway started with {} workers".format(self.workers))
+
+    async def stop(self, timeout: Optional[float] = None) -> None:
+        if self._pending:
+            logger.info("Waiting for {} Telegram calls...".format(len(self._pending)))
+            await asyncio.wait(set(self._pending), timeout=timeout)
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        for future in self._pending:
+            future.cancel()
+        logger.info("Telegram gateway stats: {}".format(self.stats()))
+
+    def stats(self) -> dict[str, Any]:
+        stats = dict(self._stats)
+        stats["queued"] = self._queue.qsize() if self._queue else 0
+        stats["delayed"] = self._delayed
+        stats["avg_wait"] = stats["total_wait"] / stats["calls"] if stats["calls"] else 0
+        stats["flood_waits"] = {
+            chat_id: round(until - time.monotonic(), 1)
+            for chat_id, until in self._chat_blocked_until.items()
+            if until > time.monotonic()
+        }
+        return stats
+
+    def _put(self, request: _Request) -> None:
+        self._queue.put_nowait((request.priority, next(self._sequence), request))
+
+    def _put_later(self, request: _Request, delay: float) -> None:
+        def _put_delayed():
+            self._delayed -= 1
+            self._put(request)
+
+        self._delayed += 1
+        asyncio.get_running_loop().call_later(delay, _put_delayed)
+
+    async def _work(self) -> None:
+        while True:
+            _, _, request = await self._queue.get()
+            try:
+                await self._process(request)
+            except Exception as exc:
+                logger.exception("Telegram gateway failed on {}: {}".format(request.method, exc))
+                if not request.future.done():
+                    request.future.set_exception(exc)
+            finally:
+                self._queue.task_done()
+
+    async def _process(self, request: _Request) -> None:
+        if request.future.done():
+            return
+
+        chat_delay = self._get_chat_delay(request.chat_id)
+        if chat_delay > 0:
+            self._stats["throttled"] += 1
+            self._put_later(request, chat_delay)
+            return
+
+        global_delay = self._get_global_delay()
+        while global_delay > 0:
+            self._stats["throttled"] += 1
+            await asyncio.sleep(global_delay)
+            global_delay = self._get_global_delay()
+
+        self._global_bucket.consume()
+        if request.chat_id is not None:
+            self._chat_buckets[request.chat_id].consume()
+
+        request.attempts += 1
+        try:
+            result = await request.bot(request.method)
+        except TelegramRetryAfter as exc:
+            self._on_retry_after(request, exc)
+        except Exception as exc:
+            self._stats["failed"] += 1
+            if not request.future.done():
+                request.future.set_exception(exc)
+        else:
+            self._stats["calls"] += 1
+            self._stats["total_wait"] += time.monotonic() - request.enqueued_at
+            if not request.future.done():
+                request.future.set_result(result)
+
+    def _get_chat_delay(self, chat_id: Optional[int | str]) -> float:
+        if chat_id is None:
+            return 0
+
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        blocked_for = self._chat_blocked_until.get(chat_id, 0) - time.monotonic()
+        return max(blocked_for, bucket.get_delay())
+
+    def _get_global_delay(self) -> float:
+        return max(self._global_blocked_until - time.monotonic(), self._global_bucket.get_delay())
+
+    def _on_retry_after(self, request: _Request, exc: TelegramRetryAfter) -> None:
+        self._stats["retry_after"] += 1
+        blocked_until = time.monotonic() + exc.retry_after
+        if request.chat_id is None:
+            self._global_blocked_until = max(self._global_blocked_until, blocked_until)
+        else:
+            self._chat_blocked_until[request.chat_id] = blocked_until
+        logger.warning(
+            "Flood control on {} for chat {}, retry in {}s".format(
+                type(request.method).__name__, request.chat_id, exc.retry_after
+            )
+        )
+
+        if request.attempts > self.max_retries:
+            self._stats["failed"] += 1
+            request.future.set_exception(exc)
+        else:
+            self._put_later(request, exc.retry_after)
+
+
+telegram_gateway = TelegramGateway(
+    TELEGRAM_GLOBAL_RATE,
+    TELEGRAM_GLOBAL_BURST,
+    TELEGRAM_CHAT_RATE,
+    TELEGRAM_CHAT_BURST,
+    TELEGRAM_GATEWAY_WORKERS,
+    TELEGRAM_MAX_RETRIES,
+)
@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from settings import UPDATES_MAX_CONCURRENCY, UPDATES_MAX_PENDING
+
+logger = logging.getLogger("cerrrbot")
+
+_Handler = Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]]
+
+
+def get_lane_key(data: dict[str, Any]) -> Optional[Hashable]:
+    # album parts come as separate updates of the same chat, so chat lane keeps them
+    # in order with button presses on their reply messages
+    chat = data.get("event_chat")
+    if chat is not None:
+        return "chat", chat.id
+    user = data.get("event_from_user")
+    if user is not None:
+        return "user", user.id
+    return None
+
+
+class UpdateLanes(BaseMiddleware):
+    # Updates of one chat are handled one by one in order of arrival, updates of
+    # different chats are handled concurrently, up to `max_concurrency` at once.
+    # Intake (polling loop or webhook workers) waits while `max_pending` updates
+    # are queued, so a forward storm doesn't pile up unbounded handlers.
+    def __init__(self, max_concurrency: int, max_pending: int):
+        self.max_concurrency = max_concurrency
+        self.max_pending = max_pending
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._intake = asyncio.Semaphore(max_pending)
+        self._lanes: dict[Hashable, deque] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self._pending = 0
+        self._stats = {"queued": 0, "handled": 0, "failed": 0, "throttled": 0, "total_wait": 0.0}
+
+    async def __call__(self, handler: _Handler, event: TelegramObject, data: dict[str, Any]) -> Any:
+        if self._intake.locked():
+            self._stats["throttled"] += 1
+        await self._intake.acquire()
+        self._pending += 1
+
+        self._stats["queued"] += 1
+        item = (handler, event, data, time.monotonic())
+        key = get_lane_key(data)
+        if key is None:
+            self._spawn(self._run_items(deque([item])))
+            return
+
+        lane = self._lanes.get(key)
+        if lane is not None:
+            lane.append(item)
+            return
+
+        self._lanes[key] = deque([item])
+        self._spawn(self._run_lane(key))
+
+    async def stop(self, timeout: Optional[float] = None) -> None:
+        if self._tasks:
+            logger.info("Waiting for updates of {} chats...".format(len(self._tasks)))
+            _, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+            for task in pending:
+                task.cancel()
+        logger.info("Update lanes stats: {}".format(self.stats()))
+
+    def stats(self) -> dict[str, Any]:
+        stats = dict(self._stats)
+        stats["pending"] = self._pending
+        stats["lanes"] = len(self._lanes)
+        stats["longest_lane"] = max(map(len, self._lanes.values()), default=0)
+        stats["avg_wait"] = stats["total_wait"] / stats["handled"] if stats["handled"] else 0
+        return stats
+
+    def _spawn(self, coro: Awaitable) -> None:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_lane(self, key: Hashable) -> None:
+        try:
+            await self._run_items(self._lanes[key])
+        finally:
+            del self._lanes[key]
+
+    async def _run_items(self, items: deque) -> None:
+        while items:
+            handler, event, data, queued_at = items[0]
+            try:
+                async with self._semaphore:
+                    self._stats["total_wait"] += time.monotonic() - queued_at
+                    await handler(event, data)
+                self._stats["handled"] += 1
+            except Exception as exc:
+                self._stats["failed"] += 1
+                logger.exception("Failed to handle update: {}".format(exc))
+            finally:
+                items.popleft()
+                self._pending -= 1
+                self._intake.release()
+
+
+update_lanes = UpdateLanes(UPDATES_MAX_CONCURRENCY, UPDATES_MAX_PENDING)
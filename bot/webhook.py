@@ -0,0 +1,160 @@
+import asyncio
+import hmac
+import logging
+import secrets
+import time
+from typing import Any, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.methods import SetWebhook
+from aiogram.types import Update
+from aiohttp import web
+
+from settings import (
+    WEBHOOK_HOST,
+    WEBHOOK_PATH,
+    WEBHOOK_PORT,
+    WEBHOOK_QUEUE_SIZE,
+    WEBHOOK_QUEUE_TIMEOUT,
+    WEBHOOK_SECRET,
+    WEBHOOK_WORKERS,
+)
+from telegram_gateway import telegram_gateway
+
+logger = logging.getLogger("cerrrbot")
+
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    # Telegram's request is answered as soon as update is queued, updates are fed
+    # to dispatcher by workers. When queue stays full, request is answered with 503,
+    # so Telegram delivers update later instead of bot piling up handlers.
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        path: str,
+        secret_token: str,
+        queue_size: int,
+        queue_timeout: float,
+        workers: int,
+    ):
+        self.host = host
+        self.port = port
+        self.path = path
+        # without secret anyone who finds URL could feed updates, so random one is used
+        self.secret_token = secret_token or secrets.token_urlsafe(32)
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.workers = workers
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: list[asyncio.Task] = []
+        self._runner: Optional[web.AppRunner] = None
+        self._stats = {"received": 0, "handled": 0, "failed": 0, "rejected": 0, "overflow": 0}
+
+    async def serve(self, dp: Dispatcher, bot: Bot, url: str, drain_timeout: float) -> None:
+        await self.start(dp, bot)
+        await telegram_gateway.call(
+            bot, SetWebhook(url=url, secret_token=self.secret_token)
+        )
+        logger.info("Webhook is set to {}".format(url))
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await self.stop(timeout=drain_timeout)
+
+    async def start(self, dp: Dispatcher, bot: Bot) -> None:
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._workers = [
+            asyncio.create_task(self._work(dp, bot)) for _ in range(self.workers)
+        ]
+
+        app = web.Application()
+        app.router.add_post(self.path, self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(
+            "Webhook server listens on {}:{}{} with {} workers".format(
+                self.host, self.port, self.path, self.workers
+            )
+        )
+
+    async def stop(self, timeout: Optional[float] = None) -> None:
+        if self._runner:
+            # stops accepting updates, not yet queued ones are redelivered by Telegram
+            await self._runner.cleanup()
+            self._runner = None
+
+        if self._queue:
+            # updates taken by workers are in progress until task_done, even if queue is empty
+            logger.info("Waiting for {} queued updates...".format(self._queue.qsize()))
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Dropped {} queued updates".format(self._queue.qsize()))
+
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        logger.info("Webhook server stats: {}".format(self.stats()))
+
+    def stats(self) -> dict[str, Any]:
+        return dict(self._stats, queued=self._queue.qsize() if self._queue else 0)
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        if not hmac.compare_digest(
+            request.headers.get(SECRET_TOKEN_HEADER, ""), self.secret_token
+        ):
+            self._stats["rejected"] += 1
+            return web.Response(status=401)
+
+        try:
+            update = Update(**await request.json())
+        except Exception as exc:
+            logger.warning("Invalid update received: {}".format(exc))
+            self._stats["rejected"] += 1
+            return web.Response(status=400)
+
+        try:
+            await asyncio.wait_for(
+                self._queue.put((time.monotonic(), update)), self.queue_timeout
+            )
+        except asyncio.TimeoutError:
+            self._stats["overflow"] += 1
+            return web.Response(status=503)
+
+        self._stats["received"] += 1
+        return web.Response()
+
+    async def _work(self, dp: Dispatcher, bot: Bot) -> None:
+        while True:
+            received_at, update = await self._queue.get()
+            try:
+                await dp.feed_update(bot, update)
+                self._stats["handled"] += 1
+            except Exception as exc:
+                self._stats["failed"] += 1
+                logger.exception(
+                    "Failed to handle update {}: {}".format(update.update_id, exc)
+                )
+            finally:
+                self._queue.task_done()
+                logger.debug(
+                    "Update {} handled in {:.3f}s".format(
+                        update.update_id, time.monotonic() - received_at
+                    )
+                )
+
+
+webhook_server = WebhookServer(
+    WEBHOOK_HOST,
+    WEBHOOK_PORT,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WEBHOOK_QUEUE_SIZE,
+    WEBHOOK_QUEUE_TIMEOUT,
+    WEBHOOK_WORKERS,
+)